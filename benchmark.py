@@ -0,0 +1,665 @@
+"""
+Benchmarks for the upload ingestion paths of the scoring API.
+
+Usage:
+    python benchmark.py excel [--rows 100000] [--data-dir DIR]
+    python benchmark.py csv [--rows 500000] [--data-dir DIR]
+    python benchmark.py manual [--requests 20000] [--distinct 200]
+    python benchmark.py latency [--rows 200000] [--uploads 2] [--seconds 20]
+    python benchmark.py suite [--sizes 1000,10000,100000,1000000] [--formats csv,xlsx] [--output results.json]
+    python benchmark.py startup [--repeat 5] [--import-budget-ms 500] [--output startup.json]
+    python benchmark.py workers [--workers 4] [--rows 20000] [--seconds 20] [--output workers.json]
+    python benchmark.py compare BASELINE.json CURRENT.json [--threshold 0.1]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+import pandas as pd
+
+import main
+from generate_mock_excel import write_portfolio
+
+
+def score_excel_pandas(path):
+    """Previous upload path: pd.read_excel for every sheet"""
+    excel_file = pd.ExcelFile(path)
+    scored = 0
+    for sheet_name in excel_file.sheet_names:
+        if sheet_name.lower() in main.INFO_SHEET_NAMES:
+            continue
+        df = pd.read_excel(excel_file, sheet_name=sheet_name)
+        scored += len(main.score_dataframe(df, sheet_name, default_product=main.detect_sheet_product(sheet_name)))
+    return scored
+
+
+def score_excel_read_only(path):
+    """Current upload path: streaming read-only reader with column projection"""
+    scored = 0
+    for sheet_name, df in main.iter_excel_sheets(path):
+        scored += len(main.score_dataframe(df, sheet_name, default_product=main.detect_sheet_product(sheet_name)))
+    return scored
+
+
+def read_csv_inferred(path):
+    """Previous CSV reader: all columns, inferred dtypes"""
+    chunks = list(pd.read_csv(path, chunksize=main.CSV_CHUNK_ROWS))
+    return sum(len(chunk) for chunk in chunks), sum(chunk.memory_usage(deep=True).sum() for chunk in chunks)
+
+
+def read_csv_projected(path):
+    """Current CSV reader: scoring columns only, pinned dtypes"""
+    chunks = list(main.iter_csv_chunks(path))
+    return sum(len(chunk) for chunk in chunks), sum(chunk.memory_usage(deep=True).sum() for chunk in chunks)
+
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_excel(rows, data_dir):
+    path = os.path.join(data_dir, f"mock_portfolio_{rows}.xlsx")
+    if not os.path.exists(path):
+        print(f"Writing {path} ...")
+        write_portfolio(path, rows)
+
+    pandas_seconds, pandas_rows = time_call(score_excel_pandas, path)
+    fast_seconds, fast_rows = time_call(score_excel_read_only, path)
+
+    print(f"Excel ingestion + scoring, {rows} rows ({os.path.getsize(path) / 1e6:.1f} MB)")
+    print(f"   - pd.read_excel:   {pandas_seconds:8.2f} s  ({pandas_rows / pandas_seconds:10.0f} rows/s)")
+    print(f"   - read-only path:  {fast_seconds:8.2f} s  ({fast_rows / fast_seconds:10.0f} rows/s)")
+    print(f"   - speedup:         {pandas_seconds / fast_seconds:8.2f}x")
+
+
+def bench_csv(rows, data_dir):
+    path = os.path.join(data_dir, f"mock_portfolio_{rows}.csv")
+    if not os.path.exists(path):
+        print(f"Writing {path} ...")
+        write_portfolio(path, rows)
+
+    inferred_seconds, (inferred_rows, inferred_bytes) = time_call(read_csv_inferred, path)
+    projected_seconds, (projected_rows, projected_bytes) = time_call(read_csv_projected, path)
+
+    print(f"CSV parsing, {rows} rows ({os.path.getsize(path) / 1e6:.1f} MB)")
+    print(f"   - all columns:     {inferred_seconds:8.2f} s  {inferred_bytes / 1e6:10.1f} MB in frames")
+    print(f"   - projected:       {projected_seconds:8.2f} s  {projected_bytes / 1e6:10.1f} MB in frames")
+    print(f"   - speedup:         {inferred_seconds / projected_seconds:8.2f}x")
+
+
+def manual_replay(requests, distinct, seed=0):
+    """Interactive form traffic: a few distinct factor vectors, each sent many times"""
+    rng = random.Random(seed)
+    vectors = []
+    for _ in range(distinct):
+        product = rng.choice(list(main.PRODUCT_FACTORS))
+        factors = {
+            name: float(rng.randint(int(config["min"]), int(config["max"])))
+            for name, config in main.PRODUCT_FACTORS[product].items()
+            if rng.random() < 0.8
+        }
+        vectors.append({"location_name": "Form", "product": product, "factors": factors})
+    return [rng.choice(vectors) for _ in range(requests)]
+
+
+def cpu_per_request(func, payloads):
+    start = time.process_time()
+    for payload in payloads:
+        func(payload)
+    return (time.process_time() - start) / len(payloads)
+
+
+def bench_manual(requests, distinct):
+    from fastapi.testclient import TestClient
+
+    payloads = manual_replay(requests, distinct)
+    client = TestClient(main.app)
+    cache_size = main.MANUAL_SCORE_CACHE_SIZE
+
+    def score(payload):
+        main.cached_product_score(payload["factors"], payload["product"])
+
+    def post(payload):
+        client.post("/score/manual", json=payload)
+
+    print(f"/score/manual replay, {requests} requests over {distinct} distinct inputs")
+    for label, func, count in (("scoring call", score, requests), ("HTTP request", post, min(requests, 5000))):
+        main.MANUAL_SCORE_CACHE_SIZE = 0
+        uncached = cpu_per_request(func, payloads[:count])
+        main.MANUAL_SCORE_CACHE_SIZE = cache_size
+        main.manual_score_cache.clear()
+        cached = cpu_per_request(func, payloads[:count])
+        print(f"   - {label + ':':15} {uncached * 1e6:8.1f} us -> {cached * 1e6:8.1f} us CPU per request")
+    print(f"   - cache: {main.manual_score_cache.stats()}")
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server():
+    """Run the app with uvicorn on a free local port in a background thread"""
+    import uvicorn
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def probe_latencies(base_url, seconds, interval=0.02):
+    """Latencies of a cheap endpoint, sampled every `interval` seconds"""
+    import httpx
+
+    latencies = []
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.get("/api/product-factors/pv")
+            latencies.append(time.perf_counter() - start)
+            time.sleep(interval)
+    return latencies
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench_latency(rows, uploads, seconds, data_dir):
+    import httpx
+
+    path = os.path.join(data_dir, f"mock_portfolio_{rows}.csv")
+    if not os.path.exists(path):
+        print(f"Writing {path} ...")
+        write_portfolio(path, rows)
+    with open(path, "rb") as handle:
+        payload = handle.read()
+    # Disable the upload cache so every request is parsed and scored
+    main.upload_cache.memory.max_bytes = 0
+
+    server, base_url = start_server()
+    stop = threading.Event()
+    statuses = []
+
+    def upload_loop():
+        with httpx.Client(base_url=base_url, timeout=300) as client:
+            while not stop.is_set():
+                response = client.post("/score/csv", params={"top_k": 10}, files={"file": ("load.csv", payload)})
+                statuses.append(response.status_code)
+
+    idle = probe_latencies(base_url, min(seconds, 5))
+    workers = [threading.Thread(target=upload_loop, daemon=True) for _ in range(uploads)]
+    for worker in workers:
+        worker.start()
+    loaded = probe_latencies(base_url, seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    server.should_exit = True
+
+    print(f"GET /api/product-factors/pv while {uploads} clients upload {rows} rows ({len(payload) / 1e6:.1f} MB) in a loop")
+    for label, latencies in (("idle", idle), ("under load", loaded)):
+        print(
+            f"   - {label + ':':12} p50 {percentile(latencies, 0.5) * 1e3:8.1f} ms"
+            f"   p99 {percentile(latencies, 0.99) * 1e3:8.1f} ms   ({len(latencies)} requests)"
+        )
+    print(f"   - uploads finished: {len(statuses)}, status codes: {sorted(set(statuses))}")
+
+
+def suite_data(rows, file_format, data_dir):
+    """Seeded mock portfolio with `rows` rows as CSV or XLSX (streamed), cached in data_dir"""
+    path = os.path.join(data_dir, f"suite_portfolio_{rows}.{file_format}")
+    if not os.path.exists(path):
+        print(f"Writing {path} ...", file=sys.stderr)
+        write_portfolio(path, rows, file_format, seed=rows)
+    return path
+
+
+def measure(func, repeat):
+    """
+    Run func once under tracemalloc for the peak allocation, then `repeat`
+    times untraced for the timings (tracemalloc slows allocation-heavy code).
+    """
+    tracemalloc.start()
+    try:
+        func()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    runs = [time_call(func)[0] for _ in range(repeat)]
+    return {"seconds": min(runs), "runs": runs, "peak_bytes": peak_bytes}
+
+
+def suite_case(results, name, items, unit, func, repeat, **params):
+    """Measure one case and append it to results with its throughput"""
+    result = measure(func, repeat)
+    key = name + ("[" + ",".join(f"{value}" for value in params.values()) + "]" if params else "")
+    results.append({
+        "case": key,
+        "name": name,
+        **params,
+        "items": items,
+        "unit": unit,
+        **result,
+        "throughput": items / result["seconds"] if result["seconds"] else None,
+    })
+    print(
+        f"   - {key:34} {result['seconds'] * 1e3:10.2f} ms  {items / result['seconds']:14.0f} {unit}/s"
+        f"  peak {result['peak_bytes'] / 1e6:8.1f} MB",
+        file=sys.stderr,
+    )
+
+
+def suite_metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_suite(sizes, formats, repeat, calls, data_dir):
+    """
+    Time the scoring functions, the upload endpoint and the template endpoints.
+
+    The upload cache is disabled so every run does the full work.
+    """
+    from fastapi.testclient import TestClient
+
+    client = TestClient(main.app)
+    main.upload_cache.memory.max_bytes = 0
+    results = []
+
+    # Micro benchmarks on values drawn from the factor ranges
+    rng = random.Random(0)
+    factor_configs = [config for factors in main.PRODUCT_FACTORS.values() for config in factors.values()]
+    values = []
+    for _ in range(calls):
+        config = rng.choice(factor_configs)
+        values.append((rng.uniform(config["min"], config["max"]), config))
+    factor_rows = [
+        (product, {name: rng.uniform(config["min"], config["max"]) for name, config in factors.items()})
+        for product, factors in (rng.choice(list(main.PRODUCT_FACTORS.items())) for _ in range(calls))
+    ]
+
+    def normalize_all():
+        for value, config in values:
+            main.normalize_factor_value(value, config)
+
+    def score_all():
+        for product, factors in factor_rows:
+            main.calculate_product_score(factors, product)
+
+    print("Scoring functions", file=sys.stderr)
+    suite_case(results, "normalize_factor_value", calls, "calls", normalize_all, repeat)
+    suite_case(results, "calculate_product_score", calls, "calls", score_all, repeat)
+
+    for rows in sizes:
+        print(f"{rows} rows", file=sys.stderr)
+        frame = pd.read_csv(suite_data(rows, "csv", data_dir))
+        suite_case(
+            results, "process_dataframe", rows, "rows",
+            lambda: main.process_dataframe(frame, "CSV"), repeat, rows=rows,
+        )
+
+        for file_format in formats:
+            with open(suite_data(rows, file_format, data_dir), "rb") as handle:
+                payload = handle.read()
+
+            def upload(payload=payload, file_format=file_format):
+                response = client.post("/score/csv", files={"file": (f"suite.{file_format}", payload)})
+                response.raise_for_status()
+
+            suite_case(results, "score_csv", rows, "rows", upload, repeat, format=file_format, rows=rows)
+
+    print("Templates", file=sys.stderr)
+    for kind, path in (("csv", "/template/csv"), ("excel", "/template/excel")):
+        builder = main.TEMPLATE_BUILDERS[kind]
+        suite_case(results, "template_build", 1, "builds", builder, repeat, kind=kind)
+
+        def download(path=path):
+            for _ in range(100):
+                client.get(path).raise_for_status()
+
+        suite_case(results, "template_endpoint", 100, "requests", download, repeat, kind=kind)
+
+    return {"meta": suite_metadata(), "results": results}
+
+
+# Runs in a fresh interpreter: import time of main, then the light endpoints
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+seconds = time.perf_counter() - start
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+client.get("/api/product-factors/pv").raise_for_status()
+client.post("/score/manual", json={"location_name": "probe", "product": "pv", "factors": {}}).raise_for_status()
+try:
+    import resource
+    peak_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+except ImportError:
+    peak_bytes = 0
+heavy = [name for name in ("pandas", "numpy", "openpyxl") if name in sys.modules]
+print(json.dumps({"seconds": seconds, "peak_bytes": peak_bytes, "heavy_modules": heavy}))
+"""
+
+# Modules the light endpoints must not import (see LazyModule in main.py)
+STARTUP_HEAVY_MODULES = ("pandas", "numpy", "openpyxl")
+
+
+def startup_import():
+    """Import time and peak RSS of main in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP_PROBE],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def startup_first_response():
+    """Seconds from spawning uvicorn until GET /api/product-factors/pv answers"""
+    import httpx
+
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+            while True:
+                try:
+                    client.get("/api/product-factors/pv").raise_for_status()
+                    return time.perf_counter() - start
+                except httpx.TransportError:
+                    if process.poll() is not None:
+                        raise RuntimeError("uvicorn exited before answering")
+                    time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run_startup(repeat, import_budget, first_response_budget):
+    """
+    Cold start benchmark in suite format (fastest of `repeat` runs).
+
+    Returns:
+        (report, budget violations)
+    """
+    imports = [startup_import() for _ in range(repeat)]
+    first_responses = [startup_first_response() for _ in range(repeat)]
+    fastest_import = min(imports, key=lambda run: run["seconds"])
+    cases = [
+        ("startup_import", fastest_import["seconds"], fastest_import["peak_bytes"], import_budget),
+        ("startup_first_response", min(first_responses), 0, first_response_budget),
+    ]
+
+    results = []
+    violations = []
+    for name, seconds, peak_bytes, budget in cases:
+        results.append({
+            "case": name, "name": name, "items": 1, "unit": "starts",
+            "seconds": seconds, "peak_bytes": peak_bytes, "throughput": 1 / seconds, "budget_seconds": budget,
+        })
+        print(f"   - {name:34} {seconds * 1e3:10.1f} ms  (budget {budget * 1e3:.0f} ms)", file=sys.stderr)
+        if seconds > budget:
+            violations.append(f"{name} took {seconds * 1e3:.0f} ms (budget {budget * 1e3:.0f} ms)")
+
+    heavy = sorted({name for run in imports for name in run["heavy_modules"]} & set(STARTUP_HEAVY_MODULES))
+    print(f"   - heavy modules after /score/manual: {heavy or 'none'}", file=sys.stderr)
+    if heavy:
+        violations.append(f"light endpoints imported {', '.join(heavy)}")
+    return {"meta": suite_metadata(), "results": results}, violations
+
+
+def serve_throughput(workers, payload, seconds, clients):
+    """
+    Completed /score/csv uploads per second against `python serve.py --workers N`.
+
+    Every request opens a new connection so the kernel spreads them over the
+    workers; the upload cache is disabled.
+    """
+    import httpx
+
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "serve.py", "--workers", str(workers), "--host", "127.0.0.1",
+            "--port", str(port), "--max-requests", "0", "--max-memory-mb", "0",
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, "SCORING_CACHE_BYTES": "0"},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        with httpx.Client(base_url=base_url) as client:
+            while True:
+                try:
+                    client.get("/api/product-factors/pv").raise_for_status()
+                    break
+                except httpx.TransportError:
+                    if process.poll() is not None:
+                        raise RuntimeError("serve.py exited before answering")
+                    time.sleep(0.05)
+
+        completed = []
+        deadline = time.perf_counter() + seconds
+
+        def upload_loop():
+            with httpx.Client(base_url=base_url, timeout=300, headers={"Connection": "close"}) as client:
+                while time.perf_counter() < deadline:
+                    response = client.post("/score/csv", params={"top_k": 10}, files={"file": ("load.csv", payload)})
+                    response.raise_for_status()
+                    if time.perf_counter() < deadline:
+                        completed.append(1)
+
+        threads = [threading.Thread(target=upload_loop) for _ in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(completed) / (time.perf_counter() - start)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def bench_workers(workers, rows, seconds, data_dir):
+    """Upload throughput of serve.py with 1 and with `workers` workers"""
+    with open(suite_data(rows, "csv", data_dir), "rb") as handle:
+        payload = handle.read()
+
+    results = []
+    baseline = None
+    for count in dict.fromkeys([1, workers]):
+        throughput = serve_throughput(count, payload, seconds, clients=2 * count)
+        baseline = baseline or throughput
+        results.append({
+            "case": f"serve_upload[{count},{rows}]", "name": "serve_upload", "workers": count, "rows": rows,
+            "items": 1, "unit": "uploads", "seconds": 1 / throughput if throughput else None,
+            "peak_bytes": 0, "throughput": throughput,
+        })
+        print(
+            f"   - {count} worker(s): {throughput:8.2f} uploads/s of {rows} rows"
+            f"  ({throughput / baseline:.2f}x, {os.cpu_count()} CPUs)",
+            file=sys.stderr,
+        )
+    return {"meta": suite_metadata(), "results": results}
+
+
+# Peak memory differences below this are noise (interpreter caches, small frames)
+MEMORY_NOISE_BYTES = 1024 * 1024
+
+
+def compare_runs(baseline, current, threshold, memory_threshold):
+    """
+    Print throughput and peak memory changes per case.
+
+    Returns:
+        Case keys whose throughput fell by more than `threshold` or whose
+        peak memory grew by more than `memory_threshold` (fractions)
+    """
+    previous = {result["case"]: result for result in baseline["results"]}
+    regressions = []
+    print(f"{'case':36} {'throughput':>24} {'change':>8} {'peak MB':>20}")
+    for result in current["results"]:
+        old = previous.get(result["case"])
+        if old is None:
+            print(f"{result['case']:36} {'(new)':>24}")
+            continue
+
+        speed = result["throughput"] / old["throughput"] - 1
+        memory = result["peak_bytes"] / old["peak_bytes"] - 1 if old["peak_bytes"] else 0.0
+        flags = []
+        if speed < -threshold:
+            flags.append("SLOWER")
+        if memory > memory_threshold and result["peak_bytes"] - old["peak_bytes"] > MEMORY_NOISE_BYTES:
+            flags.append("MORE MEMORY")
+        if flags:
+            regressions.append(result["case"])
+        print(
+            f"{result['case']:36} {old['throughput']:11.0f} -> {result['throughput']:10.0f} {speed:+8.1%}"
+            f" {old['peak_bytes'] / 1e6:8.1f} -> {result['peak_bytes'] / 1e6:8.1f}  {' '.join(flags)}"
+        )
+    missing = sorted(set(previous) - {result["case"] for result in current["results"]})
+    for case in missing:
+        print(f"{case:36} {'(missing)':>24}")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    excel = subparsers.add_parser("excel", help="compare pd.read_excel with the read-only XLSX reader")
+    excel.add_argument("--rows", type=int, default=100_000)
+    excel.add_argument("--data-dir", default=tempfile.gettempdir())
+
+    csv = subparsers.add_parser("csv", help="compare inferred pd.read_csv with the projected CSV reader")
+    csv.add_argument("--rows", type=int, default=500_000)
+    csv.add_argument("--data-dir", default=tempfile.gettempdir())
+
+    manual = subparsers.add_parser("manual", help="replay repeated /score/manual inputs with and without the memo")
+    manual.add_argument("--requests", type=int, default=20_000)
+    manual.add_argument("--distinct", type=int, default=200)
+
+    latency = subparsers.add_parser("latency", help="latency of a cheap endpoint while large uploads are scored")
+    latency.add_argument("--rows", type=int, default=200_000)
+    latency.add_argument("--uploads", type=int, default=2)
+    latency.add_argument("--seconds", type=float, default=20)
+    latency.add_argument("--data-dir", default=tempfile.gettempdir())
+
+    suite = subparsers.add_parser("suite", help="reproducible benchmark suite with JSON output")
+    suite.add_argument("--sizes", default="1000,10000,100000,1000000", help="comma separated row counts")
+    suite.add_argument("--formats", default="csv,xlsx", help="upload formats: csv and/or xlsx")
+    suite.add_argument("--repeat", type=int, default=3, help="timed runs per case (the fastest is reported)")
+    suite.add_argument("--calls", type=int, default=100_000, help="calls per scoring function micro benchmark")
+    suite.add_argument("--data-dir", default=tempfile.gettempdir())
+    suite.add_argument("--output", help="write the results as JSON to this file")
+
+    startup = subparsers.add_parser("startup", help="import time and time to first response of a cold process")
+    startup.add_argument("--repeat", type=int, default=5, help="cold starts per case (the fastest is reported)")
+    startup.add_argument("--import-budget-ms", type=float, default=500)
+    startup.add_argument("--first-response-budget-ms", type=float, default=1500)
+    startup.add_argument("--output", help="write the results as JSON to this file (readable by compare)")
+
+    workers = subparsers.add_parser("workers", help="upload throughput of serve.py with 1 vs N workers")
+    workers.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    workers.add_argument("--rows", type=int, default=20_000)
+    workers.add_argument("--seconds", type=float, default=20)
+    workers.add_argument("--data-dir", default=tempfile.gettempdir())
+    workers.add_argument("--output", help="write the results as JSON to this file (readable by compare)")
+
+    compare = subparsers.add_parser("compare", help="flag regressions between two suite results")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.10, help="allowed throughput drop (fraction)")
+    compare.add_argument("--memory-threshold", type=float, default=0.25, help="allowed peak memory growth (fraction)")
+
+    args = parser.parse_args()
+    if args.command == "excel":
+        bench_excel(args.rows, args.data_dir)
+    elif args.command == "csv":
+        bench_csv(args.rows, args.data_dir)
+    elif args.command == "manual":
+        bench_manual(args.requests, args.distinct)
+    elif args.command == "latency":
+        bench_latency(args.rows, args.uploads, args.seconds, args.data_dir)
+    elif args.command == "suite":
+        sizes = [int(size) for size in args.sizes.split(",")]
+        formats = [file_format.strip() for file_format in args.formats.split(",") if file_format.strip()]
+        report = run_suite(sizes, formats, args.repeat, args.calls, args.data_dir)
+        if args.output:
+            with open(args.output, "w") as handle:
+                json.dump(report, handle, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+    elif args.command == "startup":
+        report, violations = run_startup(
+            args.repeat, args.import_budget_ms / 1000, args.first_response_budget_ms / 1000
+        )
+        if args.output:
+            with open(args.output, "w") as handle:
+                json.dump(report, handle, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+        if violations:
+            print(f"Budget exceeded: {'; '.join(violations)}")
+            sys.exit(1)
+    elif args.command == "workers":
+        report = bench_workers(args.workers, args.rows, args.seconds, args.data_dir)
+        if args.output:
+            with open(args.output, "w") as handle:
+                json.dump(report, handle, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+    elif args.command == "compare":
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        with open(args.current) as handle:
+            current = json.load(handle)
+        regressions = compare_runs(baseline, current, args.threshold, args.memory_threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
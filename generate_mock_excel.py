@@ -1,7 +1,19 @@
 """
 Script to generate a mock Excel file with example location data for PV, Storage, and Charging products.
+
+Without arguments it writes the small formatted workbook mock_locations.xlsx.
+With --rows it streams a large, seeded portfolio for load testing:
+
+    python generate_mock_excel.py --rows 1000000 --output portfolio.csv --seed 7
+    python generate_mock_excel.py --rows 200000 --output portfolio.xlsx --missing-rate 0.05 --invalid-rate 0.01
+    python generate_mock_excel.py --rows 5000000 --output portfolio.parquet --mix pv=0.6,storage=0.2,charging=0.2
 """
 
+import argparse
+import os
+import sys
+
+import numpy as np
 import pandas as pd
 import random
 from openpyxl import load_workbook
@@ -235,6 +247,260 @@ def create_excel_file(filename="mock_locations.xlsx"):
     print(f"   - Charging sheet: {len(charging_df)} rows")
 
 
+# Value ranges of the scoring factors, as in generate_*_data: (low, high, kind)
+PRODUCT_COLUMNS = {
+    "pv": {
+        "roof_area_sqm": (100, 2000, "int"),
+        "solar_irradiation": (900, 1250, "int"),
+        "roof_orientation_degrees": (150, 210, "step10"),
+        "roof_tilt_degrees": (20, 45, "int"),
+        "electricity_price_eur": (0.25, 0.45, "price"),
+    },
+    "storage": {
+        "existing_pv_kwp": (50, 300, "int"),
+        "annual_consumption_kwh": (50000, 400000, "int"),
+        "peak_load_kw": (50, 300, "int"),
+        "grid_connection_kw": (50, 400, "int"),
+        "electricity_price_eur": (0.25, 0.45, "price"),
+    },
+    "charging": {
+        "parking_spaces": (20, 300, "int"),
+        "daily_traffic_volume": (200, 5000, "int"),
+        "avg_parking_duration_min": (30, 240, "int"),
+        "grid_connection_kw": (50, 500, "int"),
+        "ev_density_percent": (2, 20, "percent"),
+    },
+}
+
+PRODUCT_NAMES = {"pv": PV_NAMES, "storage": STORAGE_NAMES, "charging": CHARGING_NAMES}
+
+SHEET_NAMES = {"pv": "PV", "storage": "Storage", "charging": "Charging"}
+
+FACTOR_COLUMNS = list(dict.fromkeys(name for columns in PRODUCT_COLUMNS.values() for name in columns))
+
+COLUMNS = [
+    "location_id", "location_name", "address", "product",
+    "eigentuemer", "umsatz", "mitarbeiterzahl", "branche",
+] + FACTOR_COLUMNS
+
+# Ways a row can be invalid; each one hits a different branch of the upload scoring
+INVALID_KINDS = (
+    "unknown_product",   # product that is not configured -> row skipped
+    "bad_location_id",   # location_id that is not an integer -> row skipped
+    "too_few_factors",   # only two factors -> row skipped
+    "text_factor",       # non-numeric factor cell -> factor treated as missing
+    "out_of_range",      # factor far outside min/max -> clipped
+)
+
+# Rows generated per block; each block has its own seeded stream
+BLOCK_ROWS = 50_000
+
+
+def parse_mix(text):
+    """Parse "pv=0.5,storage=0.3,charging=0.2" into normalized product shares"""
+    mix = {}
+    for part in text.split(","):
+        product, _, share = part.partition("=")
+        product = product.strip().lower()
+        if product not in PRODUCT_COLUMNS:
+            raise ValueError(f"Unknown product in mix: {product}")
+        mix[product] = float(share)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("Product mix must have a positive share")
+    return {product: share / total for product, share in mix.items()}
+
+
+def generate_block(rng, first_id, rows, mix, missing_rate, invalid_rate, typed):
+    """
+    Generate one block of a portfolio as a DataFrame (all products, sparse factor columns).
+
+    Args:
+        rng: numpy Generator for this block
+        first_id: location_id of the first row
+        rows: number of rows
+        mix: product shares from parse_mix
+        missing_rate: probability that a factor cell is left empty
+        invalid_rate: share of rows made invalid (see INVALID_KINDS)
+        typed: keep factor columns numeric (no text cells), for Parquet
+    """
+    products = np.array(list(mix))
+    product_codes = rng.choice(len(products), size=rows, p=list(mix.values()))
+    product_column = products[product_codes]
+
+    names = np.empty(rows, dtype=object)
+    for code, product in enumerate(products):
+        selected = product_codes == code
+        names[selected] = np.array(PRODUCT_NAMES[product], dtype=object)[
+            rng.integers(0, len(PRODUCT_NAMES[product]), selected.sum())
+        ]
+
+    frame = {
+        "location_id": np.arange(first_id, first_id + rows, dtype=np.int64).astype(object),
+        "location_name": names,
+        "address": np.array(ADDRESSES, dtype=object)[rng.integers(0, len(ADDRESSES), rows)],
+        "product": product_column.astype(object),
+        "eigentuemer": np.array(["Ja", "Nein"], dtype=object)[rng.integers(0, 2, rows)],
+        "umsatz": rng.integers(100, 100001, rows),
+        "mitarbeiterzahl": rng.integers(1, 10001, rows),
+        "branche": np.array(INDUSTRIES, dtype=object)[rng.integers(0, len(INDUSTRIES), rows)],
+    }
+
+    factors = {name: np.full(rows, np.nan) for name in FACTOR_COLUMNS}
+    for code, product in enumerate(products):
+        selected = np.flatnonzero(product_codes == code)
+        for name, (low, high, kind) in PRODUCT_COLUMNS[product].items():
+            if kind == "int":
+                values = rng.integers(low, high + 1, len(selected)).astype(np.float64)
+            elif kind == "step10":
+                values = rng.integers(low // 10, high // 10 + 1, len(selected)) * 10.0
+            elif kind == "price":
+                values = np.round(rng.uniform(low, high, len(selected)), 2)
+            else:
+                values = np.round(rng.uniform(low, high, len(selected)), 1)
+            values[rng.random(len(selected)) < missing_rate] = np.nan
+            factors[name][selected] = values
+
+    frame.update(factors)
+    frame = pd.DataFrame(frame, columns=COLUMNS)
+
+    if invalid_rate > 0:
+        make_invalid(frame, rng, product_codes, products, invalid_rate, typed)
+    return frame
+
+
+def make_invalid(frame, rng, product_codes, products, invalid_rate, typed):
+    """Turn a share of the rows into invalid rows, cycling through INVALID_KINDS"""
+    kinds = [kind for kind in INVALID_KINDS if not (typed and kind == "text_factor")]
+    rows = np.flatnonzero(rng.random(len(frame)) < invalid_rate)
+    chosen = rng.integers(0, len(kinds), len(rows))
+
+    for kind_index, kind in enumerate(kinds):
+        selected = rows[chosen == kind_index]
+        if not len(selected):
+            continue
+        if kind == "unknown_product":
+            frame.loc[selected, "product"] = "wind"
+        elif kind == "bad_location_id":
+            frame.loc[selected, "location_id"] = None if typed else "ID-" + frame.loc[selected, "location_id"].astype(str)
+        else:
+            for code, product in enumerate(products):
+                product_rows = selected[product_codes[selected] == code]
+                if not len(product_rows):
+                    continue
+                columns = list(PRODUCT_COLUMNS[product])
+                if kind == "too_few_factors":
+                    frame.loc[product_rows, columns[2:]] = np.nan
+                    frame.loc[product_rows, columns[:2]] = 1.0
+                elif kind == "text_factor":
+                    column = columns[rng.integers(0, len(columns))]
+                    frame[column] = frame[column].astype(object)
+                    frame.loc[product_rows, column] = "k.A."  # pandas would read "n/a" as empty
+                else:
+                    column = columns[rng.integers(0, len(columns))]
+                    low, high, _ = PRODUCT_COLUMNS[product][column]
+                    frame.loc[product_rows, column] = rng.choice([-high, high * 10], len(product_rows))
+
+
+def iter_portfolio_blocks(rows, seed=0, mix=None, missing_rate=0.0, invalid_rate=0.0, typed=False):
+    """
+    Yield a seeded portfolio of `rows` rows in blocks of BLOCK_ROWS.
+
+    Every block has its own random stream derived from the seed, so the
+    output is identical for the same arguments and only one block is ever
+    held in memory.
+    """
+    mix = mix or {product: 1 / len(PRODUCT_COLUMNS) for product in PRODUCT_COLUMNS}
+    for block, start in enumerate(range(0, rows, BLOCK_ROWS)):
+        rng = np.random.default_rng([seed, block])
+        yield generate_block(rng, start + 1, min(BLOCK_ROWS, rows - start), mix, missing_rate, invalid_rate, typed)
+
+
+def write_csv(blocks, path):
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        for index, block in enumerate(blocks):
+            block.to_csv(handle, header=index == 0, index=False)
+
+
+def write_xlsx(blocks, path):
+    """Write-only workbook with one sheet per product, rows streamed to disk"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheets = {}
+    for block in blocks:
+        for product, rows in block.groupby("product", sort=False):
+            sheet_product = product if product in SHEET_NAMES else "pv"
+            if sheet_product not in sheets:
+                sheets[sheet_product] = workbook.create_sheet(SHEET_NAMES[sheet_product])
+                sheets[sheet_product].append(COLUMNS)
+            sheet = sheets[sheet_product]
+            for row in rows.itertuples(index=False):
+                sheet.append([None if isinstance(value, float) and value != value else value for value in row])
+    workbook.save(path)
+
+
+def write_parquet(blocks, path):
+    """Parquet file with a fixed schema, one row group per block"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet output requires pyarrow (pip install pyarrow)")
+
+    schema = pa.schema(
+        [
+            ("location_id", pa.int64()), ("location_name", pa.string()), ("address", pa.string()),
+            ("product", pa.string()), ("eigentuemer", pa.string()), ("umsatz", pa.int64()),
+            ("mitarbeiterzahl", pa.int64()), ("branche", pa.string()),
+        ]
+        + [(name, pa.float64()) for name in FACTOR_COLUMNS]
+    )
+    with pq.ParquetWriter(path, schema) as writer:
+        for block in blocks:
+            writer.write_table(pa.Table.from_pandas(block, schema=schema, preserve_index=False))
+
+
+WRITERS = {"csv": write_csv, "xlsx": write_xlsx, "parquet": write_parquet}
+
+
+def write_portfolio(path, rows, file_format=None, seed=0, mix=None, missing_rate=0.0, invalid_rate=0.0):
+    """
+    Stream a seeded portfolio to CSV, XLSX (write-only, one sheet per product) or Parquet.
+
+    Memory use stays constant: blocks of BLOCK_ROWS rows are generated and
+    written one after another.
+    """
+    file_format = file_format or os.path.splitext(path)[1].lstrip(".").lower()
+    if file_format not in WRITERS:
+        raise ValueError(f"Unsupported format: {file_format} (use csv, xlsx or parquet)")
+    blocks = iter_portfolio_blocks(rows, seed, mix, missing_rate, invalid_rate, typed=file_format == "parquet")
+    WRITERS[file_format](blocks, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, help="number of locations (omit for the small formatted workbook)")
+    parser.add_argument("--output", default=None, help="output file (.csv, .xlsx or .parquet)")
+    parser.add_argument("--format", choices=sorted(WRITERS), help="output format (default: from the file extension)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", default="pv=1,storage=1,charging=1", help="product shares, e.g. pv=0.6,storage=0.4")
+    parser.add_argument("--missing-rate", type=float, default=0.0, help="probability that a factor cell is empty")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="share of invalid rows")
+    args = parser.parse_args()
+
+    if args.rows is None:
+        create_excel_file(args.output or "mock_locations.xlsx")
+        return
+
+    output = args.output or f"mock_portfolio_{args.rows}.{args.format or 'csv'}"
+    try:
+        write_portfolio(output, args.rows, args.format, args.seed, parse_mix(args.mix), args.missing_rate, args.invalid_rate)
+    except ValueError as error:
+        parser.error(str(error))
+    print(f"Portfolio written: {output} ({args.rows} rows, {os.path.getsize(output) / 1e6:.1f} MB)", file=sys.stderr)
+
+
 if __name__ == "__main__":
-    create_excel_file("mock_locations.xlsx")
+    main()
 
@@ -4,15 +4,87 @@ von PV-, Speicher- und Ladeinfrastruktur-Standorten.
 Version 2.0 - Mit realistischen Metriken und produktspezifischen Faktoren
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from __future__ import annotations
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-import pandas as pd
 import io
+import itertools
+import os
+import re
+import html
+import codecs
+import gc
 import math
-from typing import Dict, List, Optional
-from pydantic import BaseModel
+import json
+import shutil
+import bisect
+import asyncio
+import functools
+import contextlib
+import contextvars
+import hashlib
+import hmac
+import importlib
+import time
+import uuid
+import cProfile
+import pstats
+import pickle
+import tempfile
+import zipfile
+import urllib.parse
+import posixpath
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from types import MappingProxyType, ModuleType
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union
+from pydantic import BaseModel, Field
+from xml.etree import ElementTree
+
+try:
+    import fcntl
+except ImportError:  # Windows: keine Dateisperre, Portfolios nur aus einem Prozess ändern
+    fcntl = None
+
+
+class LazyModule(ModuleType):
+    """
+    Platzhalter für ein Modul, das erst beim ersten Attributzugriff importiert wird.
+    
+    Danach stehen alle Attribute des Moduls direkt im Platzhalter; weitere
+    Zugriffe kosten nichts extra.
+    """
+    
+    def __getattr__(self, name: str):
+        return getattr(load_lazy_module(self), name)
+
+
+def load_lazy_module(module: ModuleType) -> ModuleType:
+    """
+    Importiert das Modul hinter einem LazyModule sofort.
+    
+    Für serve.py, das pandas/numpy vor dem fork der Worker lädt, damit
+    alle Worker sie gemeinsam nutzen.
+    
+    Returns:
+        Das importierte Modul
+    """
+    if not isinstance(module, LazyModule):
+        return module
+    loaded = importlib.import_module(module.__name__)
+    module.__dict__.update(loaded.__dict__)
+    return loaded
+
+
+# pandas/numpy erst bei Bedarf laden: /score/manual und /api/product-factors
+# antworten ohne sie, Uploads und Vorlagen importieren sie beim ersten Aufruf
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
 
 app = FastAPI(title="Standort-Scoring API")
 
@@ -235,6 +307,292 @@ def normalize_factor_value(value: float, factor_config: dict) -> float:
     return 0.5  # Fallback
 
 
+# Normalisierungskurven als Ganzzahlen, damit der Hot Path keine Strings vergleicht
+CURVE_NEUTRAL = 0
+CURVE_HIGHER = 1
+CURVE_LOWER = 2
+CURVE_LOWER_CAPPED = 3
+CURVE_TARGET = 4
+CURVE_RANGE = 5
+
+
+class FactorPlan(NamedTuple):
+    """Vorberechnete, unveränderliche Normalisierung eines Faktors"""
+    name: str
+    weight: float
+    curve: int
+    min_val: float
+    max_val: float
+    # max - min (higher/lower)
+    span: float
+    # optimal_max (lower/range) bzw. optimal_value (target)
+    pivot: float
+    # optimal_min (range)
+    pivot_low: float
+    # max - optimal_max (lower/range) bzw. max_deviation (target), 0 = Kurve endet bei 0
+    denominator: float
+    # optimal_min - min (range), 0 = Kurve endet bei 0
+    denominator_low: float
+
+
+class ScoringPlan(NamedTuple):
+    """Kompilierte Scoring-Regeln eines Produkts in Faktor-Reihenfolge"""
+    product: str
+    factors: Tuple[FactorPlan, ...]
+    factor_names: Tuple[str, ...]
+    weights: Tuple[float, ...]
+
+
+class ScoringConfig(NamedTuple):
+    """Stand der kompilierten PRODUCT_FACTORS"""
+    version: int
+    fingerprint: str
+    plans: Mapping[str, ScoringPlan]
+    # Vereinigung aller Faktorspalten über alle Produkte
+    factor_names: Tuple[str, ...]
+
+
+def compile_factor_plan(factor_name: str, factor_config: dict) -> FactorPlan:
+    """
+    Übersetzt eine Faktorkonfiguration in einen FactorPlan.
+    
+    Args:
+        factor_name: Name der Faktorspalte
+        factor_config: Konfiguration des Faktors mit min, max, optimal, etc.
+        
+    Returns:
+        FactorPlan mit vorberechneten Nennern
+    """
+    min_val = factor_config["min"]
+    max_val = factor_config["max"]
+    optimal_type = factor_config["optimal"]
+    
+    curve = CURVE_NEUTRAL
+    pivot = pivot_low = denominator = denominator_low = 0.0
+    
+    if optimal_type == "higher":
+        curve = CURVE_HIGHER
+    elif optimal_type == "lower" and "optimal_max" in factor_config:
+        curve = CURVE_LOWER_CAPPED
+        pivot = factor_config["optimal_max"]
+        denominator = max_val - pivot
+    elif optimal_type == "lower":
+        curve = CURVE_LOWER
+    elif optimal_type == "target":
+        curve = CURVE_TARGET
+        pivot = factor_config["optimal_value"]
+        denominator = max(abs(pivot - min_val), abs(max_val - pivot))
+    elif optimal_type == "range":
+        curve = CURVE_RANGE
+        pivot_low = factor_config["optimal_min"]
+        pivot = factor_config["optimal_max"]
+        denominator_low = pivot_low - min_val if pivot_low > min_val else 0.0
+        denominator = max_val - pivot if max_val > pivot else 0.0
+    
+    return FactorPlan(
+        name=factor_name,
+        weight=factor_config["weight"],
+        curve=curve,
+        min_val=min_val,
+        max_val=max_val,
+        span=max_val - min_val,
+        pivot=pivot,
+        pivot_low=pivot_low,
+        denominator=denominator,
+        denominator_low=denominator_low,
+    )
+
+
+def compile_scoring_plans(product_factors: dict) -> Mapping[str, ScoringPlan]:
+    """
+    Kompiliert alle Produktkonfigurationen in unveränderliche ScoringPlans.
+    
+    Args:
+        product_factors: Konfiguration im Format von PRODUCT_FACTORS
+        
+    Returns:
+        Schreibgeschütztes Mapping Produkt -> ScoringPlan
+    """
+    plans = {}
+    for product, product_config in product_factors.items():
+        factors = tuple(
+            compile_factor_plan(factor_name, factor_config)
+            for factor_name, factor_config in product_config.items()
+        )
+        plans[product] = ScoringPlan(
+            product=product,
+            factors=factors,
+            factor_names=tuple(factor.name for factor in factors),
+            weights=tuple(factor.weight for factor in factors),
+        )
+    return MappingProxyType(plans)
+
+
+def product_factors_fingerprint(product_factors: dict) -> str:
+    """Stabiler Hash über die komplette Faktorkonfiguration."""
+    encoded = json.dumps(product_factors, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+_scoring_config: Optional[ScoringConfig] = None
+
+
+def refresh_scoring_config() -> ScoringConfig:
+    """
+    Kompiliert PRODUCT_FACTORS neu, falls sich die Konfiguration geändert hat.
+    
+    Muss nach jeder Änderung an PRODUCT_FACTORS aufgerufen werden. Bei
+    unveränderter Konfiguration bleibt Version und Plan erhalten.
+    
+    Returns:
+        Aktuelle ScoringConfig
+    """
+    global _scoring_config
+    
+    fingerprint = product_factors_fingerprint(PRODUCT_FACTORS)
+    if _scoring_config is not None and _scoring_config.fingerprint == fingerprint:
+        return _scoring_config
+    
+    plans = compile_scoring_plans(PRODUCT_FACTORS)
+    _scoring_config = ScoringConfig(
+        version=(_scoring_config.version + 1) if _scoring_config is not None else 1,
+        fingerprint=fingerprint,
+        plans=plans,
+        factor_names=tuple(dict.fromkeys(
+            factor_name for plan in plans.values() for factor_name in plan.factor_names
+        )),
+    )
+    return _scoring_config
+
+
+def get_scoring_config() -> ScoringConfig:
+    """Liefert die aktuell kompilierte ScoringConfig (ohne Neuberechnung)."""
+    return _scoring_config
+
+
+# Beim Start einmal kompilieren
+refresh_scoring_config()
+
+
+class LRUCache:
+    """
+    Thread-sicherer LRU-Cache mit Obergrenze für Anzahl und/oder Größe.
+    
+    Die Größe eines Eintrags bestimmt `sizeof`; Einträge, die allein die
+    Obergrenze überschreiten, werden nicht aufgenommen.
+    """
+    
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.entries: "OrderedDict[object, Tuple[object, int]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key, value) -> bool:
+        """Speichert einen Eintrag und verdrängt bei Bedarf die ältesten."""
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            
+            while self.entries and (
+                (self.max_entries is not None and len(self.entries) > self.max_entries)
+                or (self.max_bytes is not None and self.bytes > self.max_bytes)
+            ):
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return True
+    
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+    
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def normalize_with_plan(value: float, factor: FactorPlan) -> float:
+    """
+    Normalisiert einen Faktorwert anhand eines FactorPlan.
+    
+    Liefert exakt dieselben Werte wie normalize_factor_value, ohne
+    Dictionary-Zugriffe und String-Vergleiche.
+    
+    Args:
+        value: Der zu normalisierende Wert
+        factor: Kompilierter Faktor
+        
+    Returns:
+        Normalisierter Wert zwischen 0 und 1
+    """
+    # Begrenze Wert auf min/max (gleiche Semantik wie max(min, min(max, value)))
+    if not value < factor.max_val:
+        value = factor.max_val
+    if not value > factor.min_val:
+        value = factor.min_val
+    
+    curve = factor.curve
+    
+    if curve == CURVE_HIGHER:
+        return (value - factor.min_val) / factor.span
+    
+    elif curve == CURVE_TARGET:
+        normalized = 1.0 - (abs(value - factor.pivot) / factor.denominator)
+        return normalized if normalized > 0 else 0
+    
+    elif curve == CURVE_RANGE:
+        if factor.pivot_low <= value <= factor.pivot:
+            return 1.0
+        elif value < factor.pivot_low:
+            return (value - factor.min_val) / factor.denominator_low if factor.denominator_low else 0
+        else:
+            return 1.0 - (value - factor.pivot) / factor.denominator if factor.denominator else 0
+    
+    elif curve == CURVE_LOWER_CAPPED:
+        if value <= factor.pivot:
+            return 1.0
+        normalized = 1.0 - (value - factor.pivot) / factor.denominator
+        return normalized if normalized > 0 else 0
+    
+    elif curve == CURVE_LOWER:
+        return 1.0 - (value - factor.min_val) / factor.span
+    
+    return 0.5  # Fallback
+
+
 def calculate_product_score(factors: Dict[str, float], product: str) -> float:
     """
     Berechnet den Score für ein Produkt basierend auf gewichteten Faktoren.
@@ -246,26 +604,56 @@ def calculate_product_score(factors: Dict[str, float], product: str) -> float:
     Returns:
         Score als Prozentsatz (0-100)
     """
-    if product not in PRODUCT_FACTORS:
+    plan = _scoring_config.plans.get(product)
+    if plan is None:
         raise ValueError(f"Unbekanntes Produkt: {product}")
     
-    product_config = PRODUCT_FACTORS[product]
     score = 0.0
     
-    for factor_name, factor_config in product_config.items():
-        if factor_name not in factors:
+    for factor in plan.factors:
+        if factor.name not in factors:
             # Faktor fehlt, neutral bewerten
             normalized_value = 0.5
         else:
-            normalized_value = normalize_factor_value(factors[factor_name], factor_config)
+            normalized_value = normalize_with_plan(factors[factor.name], factor)
         
-        weight = factor_config["weight"]
-        score += weight * normalized_value
+        score += factor.weight * normalized_value
     
     # Skaliere auf 0-100
     return round(score * 100, 1)
 
 
+# Memo für /score/manual: maximale Anzahl Einträge (0 = deaktiviert)
+MANUAL_SCORE_CACHE_SIZE = int(os.environ.get("MANUAL_SCORE_CACHE_SIZE", "4096"))
+
+manual_score_cache = LRUCache(max_entries=MANUAL_SCORE_CACHE_SIZE)
+
+
+def cached_product_score(factors: Dict[str, float], product: str) -> float:
+    """
+    calculate_product_score mit LRU-Memo.
+    
+    Schlüssel sind Produkt, die Werte der Faktoren des Produkts (None für
+    fehlende, andere Eingaben beeinflussen den Score nicht) und die
+    Version der ScoringConfig. Nach einer Änderung an PRODUCT_FACTORS
+    treffen alte Einträge daher nicht mehr und werden verdrängt.
+    """
+    config = _scoring_config
+    if MANUAL_SCORE_CACHE_SIZE <= 0:
+        return calculate_product_score(factors, product)
+    
+    plan = config.plans.get(product)
+    if plan is None:
+        raise ValueError(f"Unbekanntes Produkt: {product}")
+    
+    key = (product, tuple(factors.get(factor_name) for factor_name in plan.factor_names), config.version)
+    score = manual_score_cache.get(key)
+    if score is None:
+        score = calculate_product_score(factors, product)
+        manual_score_cache.put(key, score)
+    return score
+
+
 # Pydantic Models für API-Requests
 class ManualScoreRequest(BaseModel):
     """Request Model für manuelle Faktoreingabe"""
@@ -283,6 +671,71 @@ class ScoreResponse(BaseModel):
     factors_used: Dict[str, float]
 
 
+# Maximale Anzahl Standorte pro /score/batch-Anfrage
+BATCH_MAX_SITES = 100_000
+
+# Maximale Größe einer /score/batch-Anfrage; reicht für BATCH_MAX_SITES
+# Standorte mit Namen und allen Faktoren
+BATCH_MAX_BODY_BYTES = 32 * 1024 * 1024
+
+
+class BatchScoreRequest(BaseModel):
+    """Request Model für viele Standorte in Spaltenform (ein Array pro Feld)"""
+    product: Union[str, List[str]]  # ein Produkt für alle oder eines pro Standort
+    location_ids: List[Union[int, str]]
+    location_names: Optional[List[str]] = None
+    factors: Dict[str, List[Optional[float]]]  # null = Faktor fehlt
+
+
+class BatchScoreResponse(BaseModel):
+    """Response Model für Batch-Bewertungen, in Reihenfolge der Anfrage"""
+    location_ids: List[Union[int, str]]
+    location_names: Optional[List[str]] = None
+    scores: List[float]
+
+
+class PortfolioSite(BaseModel):
+    """Ein Standort eines gespeicherten Portfolios"""
+    location_id: int
+    location_name: str
+    product: str
+    factors: Dict[str, Optional[float]]  # null = Faktor fehlt
+
+
+class PortfolioSiteKey(BaseModel):
+    """Zu löschender Standort; ohne product werden alle Produkte gelöscht"""
+    location_id: int
+    product: Optional[str] = None
+
+
+class PortfolioChanges(BaseModel):
+    """Änderungen an einem Portfolio (erst upsert, dann delete)"""
+    upsert: List[PortfolioSite] = []
+    delete: List[PortfolioSiteKey] = []
+
+
+class WhatIfRequest(BaseModel):
+    """Geänderte Gewichte je Produkt für eine Rangliste ohne Speichern"""
+    weights: Dict[str, Dict[str, float]]  # Produkt -> Faktor -> Gewicht
+    product: Optional[str] = None  # nur Standorte dieses Produkts
+    offset: int = Field(0, ge=0)
+    limit: int = Field(1_000, ge=1, le=10_000)
+
+
+class SensitivityRequest(BaseModel):
+    """Gewichts-Sweep für die Rang-Stabilität der Standorte eines Produkts"""
+    product: str
+    weights: Dict[str, float] = {}  # Mittelpunkt, Standard aus PRODUCT_FACTORS
+    method: str = Field("random", pattern="^(random|grid)$")
+    samples: int = Field(1_000, ge=1, le=10_000)
+    spread: float = Field(0.2, gt=0, lt=1)  # relative Abweichung je Gewicht
+    seed: int = 0
+    top_k: int = Field(10, ge=1)
+    offset: int = Field(0, ge=0)
+    limit: int = Field(1_000, ge=1, le=10_000)
+
+
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
     """
@@ -334,14 +787,14 @@ async def score_manual(request: ManualScoreRequest):
         ScoreResponse mit berechneten Score
     """
     try:
-        if request.product not in PRODUCT_FACTORS:
+        if request.product not in _scoring_config.plans:
             raise HTTPException(
                 status_code=400,
                 detail=f"Ungültiges Produkt: {request.product}"
             )
         
-        # Berechne Score
-        score = calculate_product_score(request.factors, request.product)
+        # Berechne Score (gleiche Eingaben kommen vom Formular oft mehrfach)
+        score = run_profiled(cached_product_score, request.factors, request.product)
         
         return ScoreResponse(
             location_name=request.location_name,
@@ -354,183 +807,3930 @@ async def score_manual(request: ManualScoreRequest):
         raise HTTPException(status_code=500, detail=f"Fehler bei Score-Berechnung: {str(e)}")
 
 
-@app.post("/score/csv")
-async def score_csv(file: UploadFile = File(...)):
+@app.post("/score/batch", response_model=BatchScoreResponse)
+async def score_batch(request: BatchScoreRequest):
     """
-    Verarbeitet eine CSV- oder Excel-Datei und berechnet Scores für alle Standorte.
+    Berechnet Scores für viele Standorte in einem Aufruf.
     
-    Excel-Dateien können mehrere Sheets enthalten (eines pro Produkt).
-    CSV-Dateien müssen eine 'product' Spalte haben.
+    Gleiche Regeln wie /score/manual: fehlende Faktoren (null oder nicht
+    übergebene Spalte) werden neutral bewertet, es gibt keine
+    Mindestanzahl an Faktoren. Alle Standorte eines Produkts werden in
+    einem Durchlauf spaltenweise bewertet.
     
+    Args:
+        request: BatchScoreRequest mit product, location_ids, optional
+            location_names und einem Werte-Array pro Faktor
+        
     Returns:
-        JSON-Liste mit location_id, location_name, product und score,
-        sortiert nach Score (höchster zuerst)
+        BatchScoreResponse mit scores in Reihenfolge von location_ids
     """
-    try:
-        # Lese Datei
-        contents = await file.read()
-        filename = file.filename.lower()
-        
-        results = []
-        
-        if filename.endswith('.csv'):
-            # CSV: Eine Datei mit product-Spalte
-            df = pd.read_csv(io.BytesIO(contents))
-            results = process_dataframe(df, "CSV")
-            
-        elif filename.endswith(('.xlsx', '.xls')):
-            # Excel: Mehrere Sheets möglich
-            excel_file = pd.ExcelFile(io.BytesIO(contents))
-            
-            # Verarbeite jedes Sheet
-            for sheet_name in excel_file.sheet_names:
-                # Überspringe Info-Sheets
-                if sheet_name.lower() in ['info', 'anleitung', 'instructions', 'readme']:
-                    continue
-                
-                df = pd.read_excel(excel_file, sheet_name=sheet_name)
-                
-                # Versuche Produkt aus Sheet-Namen zu ermitteln
-                sheet_product = None
-                if 'pv' in sheet_name.lower() or 'photovoltaik' in sheet_name.lower():
-                    sheet_product = 'pv'
-                elif 'storage' in sheet_name.lower() or 'speicher' in sheet_name.lower():
-                    sheet_product = 'storage'
-                elif 'charging' in sheet_name.lower() or 'laden' in sheet_name.lower() or 'ladeinfrastruktur' in sheet_name.lower():
-                    sheet_product = 'charging'
-                
-                sheet_results = process_dataframe(df, sheet_name, default_product=sheet_product)
-                results.extend(sheet_results)
-        else:
+    config = _scoring_config
+    size = len(request.location_ids)
+    
+    # Den Body begrenzt bereits BatchBodyLimitMiddleware; kleinere Anfragen
+    # können trotzdem zu viele Standorte enthalten
+    if size > BATCH_MAX_SITES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Zu viele Standorte: {size} (maximal {BATCH_MAX_SITES} pro Anfrage)"
+        )
+    
+    columns = {"location_names": request.location_names, **request.factors}
+    if isinstance(request.product, list):
+        columns["product"] = request.product
+    for name, values in columns.items():
+        if values is not None and len(values) != size:
             raise HTTPException(
                 status_code=400,
-                detail="Ungültiges Dateiformat. Bitte CSV oder Excel (.xlsx, .xls) hochladen."
+                detail=f"Spalte '{name}' hat {len(values)} Werte, erwartet {size} (Länge von location_ids)"
             )
+    
+    products = [request.product] if isinstance(request.product, str) else request.product
+    unknown = sorted(set(products) - set(config.plans))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Ungültiges Produkt: {', '.join(unknown)}")
+    
+    release = blocking_work.admit()
+    try:
+        return await blocking_work.run(batch_response, request, config)
+    finally:
+        release()
+
+
+class BatchBodyLimitMiddleware:
+    """
+    ASGI-Middleware: weist /score/batch-Anfragen über BATCH_MAX_BODY_BYTES
+    mit 413 ab, bevor der Body gelesen und als JSON geparst wird.
+    
+    Maßgeblich ist Content-Length; Anfragen ohne Längenangabe (chunked)
+    werden beim Lesen gezählt und nach Überschreiten der Grenze abgebrochen.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != "/score/batch":
+            await self.app(scope, receive, send)
+            return
         
-        if not results:
-            raise HTTPException(
-                status_code=400,
-                detail="Keine gültigen Daten gefunden. Bitte überprüfen Sie das Dateiformat."
-            )
+        detail = f"Anfrage zu groß (maximal {BATCH_MAX_BODY_BYTES} Bytes pro Anfrage)"
+        headers = dict(scope["headers"])
+        try:
+            length = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            length = 0
+        if length > BATCH_MAX_BODY_BYTES:
+            response = JSONResponse(status_code=413, content={"detail": detail})
+            await response(scope, receive, send)
+            return
         
-        # Sortiere nach Score (höchster zuerst)
-        results.sort(key=lambda x: x["score"], reverse=True)
+        received = 0
         
-        return JSONResponse(content=results)
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > BATCH_MAX_BODY_BYTES:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
         
-    except pd.errors.EmptyDataError:
-        raise HTTPException(status_code=400, detail="Die Datei ist leer")
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Fehler: {str(e)}")
+        await self.app(scope, receive_limited, send)
 
 
-def process_dataframe(df: pd.DataFrame, source_name: str, default_product: str = None) -> List[dict]:
+app.add_middleware(BatchBodyLimitMiddleware)
+
+
+def batch_response(request: BatchScoreRequest, config: ScoringConfig) -> JSONResponse:
+    """Bewertet einen bereits validierten BatchScoreRequest spaltenweise."""
+    size = len(request.location_ids)
+    
+    if isinstance(request.product, str):
+        product_rows = [(request.product, np.arange(size))]
+    else:
+        product_array = np.array(request.product, dtype=object)
+        product_rows = [(product, np.flatnonzero(product_array == product)) for product in dict.fromkeys(request.product)]
+    
+    # null wird zu NaN und damit wie ein fehlender Faktor behandelt
+    factor_values = {name: np.array(values, dtype=np.float64) for name, values in request.factors.items()}
+    scores = np.empty(size)
+    
+    for product, rows in product_rows:
+        plan = config.plans[product]
+        plan_columns = [
+            factor_values[factor_name][rows] if factor_name in factor_values else np.full(len(rows), np.nan)
+            for factor_name in plan.factor_names
+        ]
+        plan_scores, _ = _score_factor_columns(plan, plan_columns)
+        scores[rows] = _round_scores(plan_scores)
+    
+    content = {"location_ids": request.location_ids}
+    if request.location_names is not None:
+        content["location_names"] = request.location_names
+    content["scores"] = scores.tolist()
+    return JSONResponse(content=content)
+
+
+# Metriken (/metrics) und Server-Timing-Header; "0" schaltet beides ab
+SCORING_METRICS = os.environ.get("SCORING_METRICS", "1") != "0"
+
+# Verarbeitungsschritte eines Uploads, in Reihenfolge des Server-Timing-Headers
+METRIC_STAGES = ("hash", "parse", "score", "rank", "serialize")
+
+# Gründe, aus denen score_dataframe Zeilen überspringt
+SKIP_REASONS = ("product", "factors", "location_id")
+
+# Schrittzeiten der laufenden Anfrage (gesetzt von ServerTimingMiddleware)
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+class ScoringMetrics:
     """
-    Verarbeitet ein DataFrame und berechnet Scores.
+    Prozessweite Zähler und Schritt-Timer der Upload-Verarbeitung.
     
-    Args:
-        df: Pandas DataFrame mit Standortdaten
-        source_name: Name der Quelle (für Fehlermeldungen)
-        default_product: Standard-Produkt wenn keine product-Spalte vorhanden
-        
-    Returns:
-        Liste mit Score-Ergebnissen
+    Gemessene Zeiten werden außerdem in die Timings der laufenden Anfrage
+    eingetragen, aus denen ServerTimingMiddleware den Server-Timing-Header
+    baut. Ist enabled False, kehren alle Methoden sofort zurück.
     """
-    results = []
     
-    # Überspringe leere DataFrames
-    if df.empty:
-        return results
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.stage_seconds = dict.fromkeys(METRIC_STAGES, 0.0)
+        self.stage_calls = dict.fromkeys(METRIC_STAGES, 0)
+        self.rows_in = 0
+        self.rows_scored: Dict[str, int] = {}
+        self.rows_skipped = dict.fromkeys(SKIP_REASONS, 0)
+        self.uploads = 0
+        self.upload_bytes = 0
     
-    # Validiere erforderliche Spalten
-    required_columns = ["location_id", "location_name"]
-    missing_columns = [col for col in required_columns if col not in df.columns]
+    def observe(self, stage: str, seconds: float) -> None:
+        """Addiert die Dauer eines Verarbeitungsschritts."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.stage_seconds[stage] += seconds
+            self.stage_calls[stage] += 1
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
     
-    if missing_columns:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Fehlende Spalten in {source_name}: {', '.join(missing_columns)}"
-        )
+    def timer(self, stage: str):
+        """Context-Manager, der die Dauer des Blocks als stage erfasst."""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._timer(stage)
     
-    # Prüfe ob product-Spalte vorhanden ist
-    has_product_column = "product" in df.columns
+    @contextlib.contextmanager
+    def _timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
     
-    if not has_product_column and not default_product:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Keine 'product' Spalte in {source_name} gefunden und kein Standard-Produkt erkannt"
-        )
+    def timed(self, iterator: Iterator, stage: str) -> Iterator:
+        """Erfasst die Zeit, die iterator für jedes Element braucht (z.B. read_csv-Blöcke)."""
+        if not self.enabled:
+            return iterator
+        return self._timed(iter(iterator), stage)
     
-    # Berechne Scores für jede Zeile
-    for idx, row in df.iterrows():
+    def _timed(self, iterator: Iterator, stage: str) -> Iterator:
         try:
-            # Bestimme Produkt
-            if has_product_column and pd.notna(row["product"]):
-                product = str(row["product"]).lower().strip()
-            elif default_product:
-                product = default_product
-            else:
-                continue
-            
-            if product not in PRODUCT_FACTORS:
-                # Ungültiges Produkt, überspringe Zeile
-                continue
-            
-            # Extrahiere Faktoren für dieses Produkt
-            factors = {}
-            product_config = PRODUCT_FACTORS[product]
-            
-            for factor_name in product_config.keys():
-                if factor_name in row and pd.notna(row[factor_name]):
-                    try:
-                        factors[factor_name] = float(row[factor_name])
-                    except (ValueError, TypeError):
-                        # Ungültiger Wert, überspringe diesen Faktor
-                        pass
-            
-            # Überspringe wenn zu wenig Faktoren vorhanden
-            if len(factors) < 3:
-                continue
-            
-            # Berechne Score
-            score = calculate_product_score(factors, product)
-            
-            results.append({
-                "location_id": int(row["location_id"]),
-                "location_name": str(row["location_name"]),
-                "product": product,
-                "score": score,
-                "factors_used": factors
-            })
-            
-        except Exception as e:
-            # Einzelne fehlerhafte Zeilen überspringen
-            continue
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.observe(stage, time.perf_counter() - start)
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+    
+    def count_rows(self, rows_in: int, scored: Dict[str, int], skipped: Dict[str, int]) -> None:
+        """Zählt gelesene, bewertete (je Produkt) und übersprungene (je Grund) Zeilen."""
+        with self.lock:
+            self.rows_in += rows_in
+            for product, rows in scored.items():
+                self.rows_scored[product] = self.rows_scored.get(product, 0) + rows
+            for reason, rows in skipped.items():
+                self.rows_skipped[reason] += rows
     
-    return results
+    def count_upload(self, size: int) -> None:
+        """Zählt einen Upload und seine Größe in Bytes."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.uploads += 1
+            self.upload_bytes += size
+    
+    def render(self) -> str:
+        """Alle Werte im Prometheus-Textformat."""
+        with self.lock:
+            metrics = [
+                ("scoring_stage_seconds_total", "Zeit je Verarbeitungsschritt",
+                 [({"stage": stage}, seconds) for stage, seconds in self.stage_seconds.items()]),
+                ("scoring_stage_calls_total", "Aufrufe je Verarbeitungsschritt",
+                 [({"stage": stage}, calls) for stage, calls in self.stage_calls.items()]),
+                ("scoring_rows_in_total", "Zeilen, die das Scoring erreicht haben", [({}, self.rows_in)]),
+                ("scoring_rows_scored_total", "Bewertete Zeilen je Produkt",
+                 [({"product": product}, rows) for product, rows in sorted(self.rows_scored.items())]),
+                ("scoring_rows_skipped_total", "Übersprungene Zeilen je Grund",
+                 [({"reason": reason}, rows) for reason, rows in self.rows_skipped.items()]),
+                ("scoring_uploads_total", "Bewertete Uploads (/score/csv)", [({}, self.uploads)]),
+                ("scoring_upload_bytes_total", "Gelesene Upload-Bytes (/score/csv)", [({}, self.upload_bytes)]),
+            ]
+        
+        lines = []
+        for name, help_text, samples in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
 
 
-@app.get("/template/csv")
-async def download_csv_template():
+metrics = ScoringMetrics(SCORING_METRICS)
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """Formatiert Schrittzeiten (Sekunden) als Server-Timing-Header (Millisekunden)."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+class ServerTimingMiddleware:
     """
-    Lädt eine CSV-Vorlagendatei mit Beispieldaten für alle Produkte herunter.
+    ASGI-Middleware: sammelt die Schrittzeiten jeder Anfrage und hängt sie
+    als Server-Timing-Header an (nur wenn ein Schritt gemessen wurde).
+    
+    Bei Streaming-Antworten enthält der Header die Schritte bis zum Start
+    der Antwort.
     """
-    # Erstelle Template-Daten für alle Produkte (Reduziert auf Top 5)
-    pv_data = {
-        "location_id": 1,
-        "location_name": "Beispiel PV-Standort",
-        "product": "pv",
-        "roof_area_sqm": 250,
-        "solar_irradiation": 1100,
-        "roof_orientation_degrees": 180,
-        "roof_tilt_degrees": 32,
-        "electricity_price_eur": 0.35
-    }
     
-    storage_data = {
-        "location_id": 2,
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and timings:
+                timings["total"] = time.perf_counter() - start
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(timings).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+
+
+if SCORING_METRICS:
+    app.add_middleware(ServerTimingMiddleware)
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Liefert Treffer-, Fehl- und Verdrängungszähler der Caches.
+    
+    Returns:
+        Dictionary mit Statistiken für manuelle Scores und Uploads
+    """
+    return {
+        "config_version": _scoring_config.version,
+        "manual": manual_score_cache.stats(),
+        "uploads": upload_cache.stats(),
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Zähler und Schrittzeiten der Upload-Verarbeitung im Prometheus-Textformat.
+    
+    Raises:
+        HTTPException: 404 wenn SCORING_METRICS=0
+    """
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metriken sind deaktiviert")
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# Token für Request-Profiling und /profiles (leer = Profiling deaktiviert)
+SCORING_PROFILE_TOKEN = os.environ.get("SCORING_PROFILE_TOKEN", "")
+
+# Ablage der Profile (pstats + Metadaten)
+SCORING_PROFILES_DIR = os.environ.get("SCORING_PROFILES_DIR") or os.path.join(tempfile.gettempdir(), "scoring_profiles")
+
+# Anzahl aufbewahrter Profile, ältere werden beim Schreiben gelöscht
+SCORING_PROFILES_KEEP = int(os.environ.get("SCORING_PROFILES_KEEP", "50"))
+
+# Endpunkte, die mit X-Profile-Token bzw. ?profile_token= profiliert werden
+PROFILED_PATHS = ("/score/csv", "/score/manual")
+
+PROFILE_ID_PATTERN = re.compile(r"\d{8}-\d{6}-[0-9a-f]{8}")
+
+
+class RequestProfile:
+    """
+    cProfile-Daten einer profilierten Anfrage.
+    
+    Die Arbeit einer Anfrage läuft abwechselnd in der Event-Loop und in
+    Threads von blocking_work; jeder Aufruf wird mit einem eigenen
+    cProfile.Profile gemessen und in stats zusammengeführt.
+    """
+    
+    def __init__(self):
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.lock = threading.Lock()
+        self.stats: Optional[pstats.Stats] = None
+    
+    def runcall(self, func, *args):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Anderer Profiler aktiv (ab Python 3.12 prozessweit): ungemessen ausführen
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            with self.lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+    
+    def save(self, directory: str, meta: dict) -> None:
+        """Schreibt <id>.prof (pstats) und <id>.json und löscht überzählige alte Profile."""
+        if self.stats is None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.stats.dump_stats(os.path.join(directory, f"{self.profile_id}.prof"))
+        with open(os.path.join(directory, f"{self.profile_id}.json"), "w", encoding="utf-8") as handle:
+            json.dump({"profile_id": self.profile_id, **meta}, handle)
+        
+        for profile_id in list_profile_ids(directory)[SCORING_PROFILES_KEEP:]:
+            for extension in (".prof", ".json"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(directory, profile_id + extension))
+
+
+# Profil der laufenden Anfrage (gesetzt von ProfilingMiddleware)
+_request_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    "request_profile", default=None
+)
+
+
+def run_profiled(func, *args):
+    """func(*args), bei aktivem Request-Profiling unter cProfile."""
+    profile = _request_profile.get()
+    if profile is None:
+        return func(*args)
+    return profile.runcall(func, *args)
+
+
+def list_profile_ids(directory: str) -> List[str]:
+    """IDs der gespeicherten Profile, neueste zuerst."""
+    if not os.path.isdir(directory):
+        return []
+    entries = [
+        (entry.stat().st_mtime, entry.name[:-5])
+        for entry in os.scandir(directory)
+        if entry.name.endswith(".prof") and PROFILE_ID_PATTERN.fullmatch(entry.name[:-5])
+    ]
+    return [profile_id for _, profile_id in sorted(entries, reverse=True)]
+
+
+def profile_token_matches(token: Optional[str]) -> bool:
+    return bool(SCORING_PROFILE_TOKEN) and token is not None and hmac.compare_digest(
+        token.encode(), SCORING_PROFILE_TOKEN.encode()
+    )
+
+
+def request_profile_token(headers: Mapping[str, str], query: Mapping[str, str]) -> Optional[str]:
+    """Profiling-Token aus Header X-Profile-Token oder Query-Parameter profile_token."""
+    return headers.get("x-profile-token") or query.get("profile_token")
+
+
+class ProfilingMiddleware:
+    """
+    ASGI-Middleware: profiliert Anfragen an PROFILED_PATHS, die das
+    Profiling-Token mitschicken, und speichert das Profil nach der letzten
+    Antwort-Zeile (auch bei Streaming). Die Antwort trägt die ID im Header
+    X-Profile-Id. Ein falsches Token wird mit 403 abgewiesen.
+    
+    Arbeit in den Worker-Prozessen von SCORING_PROCESS_WORKERS wird nicht
+    erfasst.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in PROFILED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        query = dict(urllib.parse.parse_qsl(scope["query_string"].decode("latin-1")))
+        token = request_profile_token(headers, query)
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+        if not profile_token_matches(token):
+            response = JSONResponse(status_code=403, content={"detail": "Ungültiges Profiling-Token"})
+            await response(scope, receive, send)
+            return
+        
+        profile = RequestProfile()
+        status_code = 500
+        context_token = _request_profile.set(profile)
+        start = time.perf_counter()
+        
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile.profile_id.encode())],
+                }
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _request_profile.reset(context_token)
+            meta = {
+                "path": scope["path"],
+                "query": scope["query_string"].decode("latin-1"),
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                "created_at": time.time(),
+            }
+            await asyncio.get_running_loop().run_in_executor(None, profile.save, SCORING_PROFILES_DIR, meta)
+
+
+if SCORING_PROFILE_TOKEN:
+    app.add_middleware(ProfilingMiddleware)
+
+
+def check_profile_token(request: Request) -> None:
+    """
+    Raises:
+        HTTPException: 404 wenn Profiling deaktiviert ist, 403 bei falschem Token
+    """
+    if not SCORING_PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling ist deaktiviert")
+    if not profile_token_matches(request_profile_token(request.headers, request.query_params)):
+        raise HTTPException(status_code=403, detail="Ungültiges Profiling-Token")
+
+
+@app.get("/profiles")
+async def list_profiles(request: Request):
+    """
+    Listet gespeicherte Request-Profile (neueste zuerst).
+    
+    Erfordert das Profiling-Token (X-Profile-Token oder ?profile_token=).
+    
+    Returns:
+        Dictionary mit einer Liste aus profile_id, path, status, duration_ms
+        und created_at
+    """
+    check_profile_token(request)
+    profiles = []
+    for profile_id in list_profile_ids(SCORING_PROFILES_DIR):
+        try:
+            with open(os.path.join(SCORING_PROFILES_DIR, f"{profile_id}.json"), encoding="utf-8") as handle:
+                profiles.append(json.load(handle))
+        except (OSError, ValueError):
+            profiles.append({"profile_id": profile_id})
+    return {"profiles": profiles}
+
+
+@app.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, request: Request):
+    """
+    Lädt ein Profil im pstats-Format herunter (z.B. für snakeviz oder
+    flameprof).
+    
+    Raises:
+        HTTPException: 404 bei unbekannter ID
+    """
+    check_profile_token(request)
+    path = os.path.join(SCORING_PROFILES_DIR, f"{profile_id}.prof")
+    if not PROFILE_ID_PATTERN.fullmatch(profile_id) or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Profil nicht gefunden")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
+
+@app.post("/score/csv")
+async def score_csv(
+    file: UploadFile = File(...),
+    top_k: Optional[int] = Query(None, ge=1, description="Nur die besten k Standorte liefern"),
+    per_product: bool = Query(False, description="top_k je Produkt statt insgesamt anwenden"),
+    output_format: str = Query(
+        "json",
+        alias="format",
+        pattern="^(json|ndjson|ndjson-ranked|parquet|arrow)$",
+        description=(
+            "json (Liste), ndjson (Zeilen sobald bewertet), ndjson-ranked (sortiert gestreamt) "
+            "oder parquet/arrow (Rangliste als Datei)"
+        ),
+    ),
+    diagnostics: bool = Query(False, description="Übersprungene Zeilen und ungültige Zellen mitliefern (nur format=json)"),
+):
+    """
+    Verarbeitet eine CSV-, Excel-, Parquet- oder Arrow-Datei und berechnet
+    Scores für alle Standorte.
+    
+    Excel-Dateien können mehrere Sheets enthalten (eines pro Produkt).
+    CSV-, Parquet- und Arrow-Dateien müssen eine 'product' Spalte haben und
+    werden blockweise eingelesen, damit der Speicherbedarf unabhängig von
+    der Dateigröße bleibt.
+    
+    Args:
+        file: CSV-, Excel-, Parquet- oder Arrow-IPC-Datei
+        top_k: Optional, nur die besten k Standorte zurückgeben
+        per_product: top_k für jedes Produkt einzeln anwenden
+        output_format: "json" liefert eine sortierte JSON-Liste, "ndjson"
+            streamt Ergebnisse in Dateireihenfolge sobald ein Block bewertet
+            ist, "ndjson-ranked" streamt die fertige Rangliste, "parquet" und
+            "arrow" liefern die Rangliste als Datei (eine Spalte pro Faktor)
+        diagnostics: Antwort als {"results": [...], "diagnostics": {...}} mit
+            Anzahl und ersten Zeilennummern je Spalte und Grund (siehe
+            ScoringDiagnostics)
+    
+    Returns:
+        JSON-Liste, NDJSON-Stream bzw. Parquet-/Arrow-Datei mit location_id,
+        location_name, product und score, sortiert nach Score (höchster zuerst)
+    """
+    # Parsing und Scoring laufen im Thread-Pool; bei Überlast sofort 503
+    release = blocking_work.admit()
+    streaming = False
+    
+    try:
+        filename = file.filename.lower()
+        check_upload_filename(filename)
+        
+        if output_format in ARROW_DOWNLOADS:
+            # Vor dem Bewerten prüfen, ob der Export möglich ist
+            import_pyarrow()
+        
+        if metrics.enabled:
+            file.file.seek(0, os.SEEK_END)
+            metrics.count_upload(file.file.tell())
+            file.file.seek(0)
+        
+        if diagnostics and output_format != "json":
+            raise HTTPException(status_code=400, detail="diagnostics ist nur mit format=json möglich")
+        
+        if output_format == "ndjson" and top_k is not None:
+            raise HTTPException(
+                status_code=400,
+                detail="top_k ist nur mit sortierter Ausgabe (format=json oder ndjson-ranked) möglich"
+            )
+        
+        # Identische Uploads bei unveränderter Konfiguration nicht neu bewerten
+        # (profilierte Anfragen werden immer bewertet)
+        use_cache = upload_cache.enabled and _request_profile.get() is None
+        cache_key = await blocking_work.run(upload_cache.key, file.file, filename) if use_cache else None
+        cached = await blocking_work.run(upload_cache.get, cache_key) if cache_key else None
+        if cached is not None:
+            results = _aiter_frames([cached])
+        else:
+            results = aiter_upload_results(file.file, filename)
+            if cache_key:
+                results = upload_cache.collect(cache_key, results)
+        headers = {"X-Cache": "HIT" if cached is not None else "MISS"}
+        
+        if output_format == "ndjson":
+            # Ersten Block vorab bewerten, damit Formatfehler als HTTP-Fehler ankommen
+            first_result = None
+            async for result in results:
+                if not result.empty:
+                    first_result = result
+                    break
+            if first_result is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Keine gültigen Daten gefunden. Bitte überprüfen Sie das Dateiformat."
+                )
+            streaming = True
+            return StreamingResponse(
+                release_after(aiter_ndjson(first_result, results), release),
+                media_type="application/x-ndjson",
+                headers=headers,
+            )
+        
+        ranking = ScoreRanking(top_k=top_k, per_product=per_product)
+        upload_diagnostics = ScoringDiagnostics() if diagnostics else None
+        async for result in results:
+            if upload_diagnostics is not None:
+                upload_diagnostics.merge_frame(result)
+            await blocking_work.run(ranking.add, result)
+        
+        if not len(ranking):
+            detail = "Keine gültigen Daten gefunden. Bitte überprüfen Sie das Dateiformat."
+            if upload_diagnostics is not None:
+                detail = {"message": detail, "diagnostics": upload_diagnostics.to_dict()}
+            raise HTTPException(status_code=400, detail=detail)
+        
+        # Sortieren und Serialisieren ebenfalls außerhalb der Event-Loop
+        return await blocking_work.run(ranking_response, ranking, output_format, headers, upload_diagnostics)
+        
+    except pd.errors.EmptyDataError:
+        raise HTTPException(status_code=400, detail="Die Datei ist leer")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Fehler: {str(e)}")
+    finally:
+        if not streaming:
+            release()
+
+
+def ranking_response(ranking: "ScoreRanking", output_format: str, headers: Dict[str, str],
+                     diagnostics: Optional["ScoringDiagnostics"] = None) -> Response:
+    """
+    Baut die Antwort aus der fertigen Rangliste (höchster Score zuerst).
+    
+    Args:
+        ranking: ScoreRanking mit allen Ergebnisblöcken
+        output_format: "json", "ndjson-ranked", "parquet" oder "arrow"
+        headers: Zusätzliche Response-Header
+        diagnostics: Optional, JSON-Antwort als Objekt mit results und diagnostics
+    """
+    with metrics.timer("serialize"):
+        if output_format in ARROW_DOWNLOADS:
+            media_type, extension = ARROW_DOWNLOADS[output_format]
+            headers["Content-Disposition"] = f"attachment; filename=scores.{extension}"
+            return Response(
+                content=frame_to_arrow_bytes(ranking.to_frame(), output_format),
+                media_type=media_type,
+                headers=headers,
+            )
+        
+        if output_format == "ndjson-ranked":
+            return StreamingResponse(
+                iter_ndjson([ranking.to_frame()]), media_type="application/x-ndjson", headers=headers
+            )
+        
+        # Rangliste nach Score (höchster zuerst)
+        if diagnostics is not None:
+            return JSONResponse(
+                content={"results": ranking.to_records(), "diagnostics": diagnostics.to_dict()}, headers=headers
+            )
+        return JSONResponse(content=ranking.to_records(), headers=headers)
+
+
+# Sheets ohne Standortdaten
+INFO_SHEET_NAMES = ['info', 'anleitung', 'instructions', 'readme']
+
+# Zeilen pro Block beim Einlesen von CSV-Dateien
+CSV_CHUNK_ROWS = 50_000
+
+# Zeilen pro geschriebenem Block bei NDJSON-Antworten
+NDJSON_BATCH_ROWS = 1_000
+
+# Spalten neben den Faktoren, die beim Import gelesen werden
+CSV_ID_COLUMNS = ("location_id", "location_name", "product")
+
+
+def detect_sheet_product(sheet_name: str) -> Optional[str]:
+    """
+    Ermittelt das Produkt anhand des Sheet-Namens.
+    
+    Returns:
+        "pv", "storage", "charging" oder None
+    """
+    name = sheet_name.lower()
+    if 'pv' in name or 'photovoltaik' in name:
+        return 'pv'
+    elif 'storage' in name or 'speicher' in name:
+        return 'storage'
+    elif 'charging' in name or 'laden' in name or 'ladeinfrastruktur' in name:
+        return 'charging'
+    return None
+
+
+def iter_csv_results(source, source_name: str, chunk_rows: int = CSV_CHUNK_ROWS,
+                     progress: Optional[Callable[[int, int], None]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Liest eine CSV-Datei blockweise und bewertet jeden Block.
+    
+    Es wird nie mehr als ein Block Rohdaten gleichzeitig gehalten; die
+    Ergebnisse sind kompakte DataFrames aus score_dataframe.
+    
+    Args:
+        source: Dateiobjekt oder Pfad der CSV-Datei
+        source_name: Name der Quelle (für Fehlermeldungen)
+        chunk_rows: Zeilen pro Block
+        progress: Optional, wird je Block mit (gelesene, bewertete Zeilen) aufgerufen
+        
+    Yields:
+        Ergebnis-DataFrame je Block
+    """
+    for chunk in metrics.timed(iter_csv_chunks(source, chunk_rows), "parse"):
+        yield score_chunk(chunk, source_name, progress=progress)
+
+
+def score_chunk(df: pd.DataFrame, source_name: str, default_product: Optional[str] = None,
+                progress: Optional[Callable[[int, int], None]] = None) -> pd.DataFrame:
+    """score_dataframe mit Rückmeldung (gelesene, bewertete Zeilen) an progress."""
+    with metrics.timer("score"):
+        result = score_dataframe(df, source_name, default_product=default_product)
+    if progress is not None:
+        progress(len(df), len(result))
+    return result
+
+
+def scoring_columns(columns) -> List[str]:
+    """
+    Spalten einer Quelle, die für das Scoring gelesen werden müssen.
+    
+    Ohne eine einzige bekannte Spalte wird die erste Spalte geliefert,
+    damit Zeilen ankommen und die Spaltenvalidierung greift.
+    """
+    factor_names = set(_scoring_config.factor_names)
+    selected = [column for column in columns if column in CSV_ID_COLUMNS or column in factor_names]
+    return selected or list(columns[:1])
+
+
+def iter_csv_chunks(source, chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Liest eine CSV-Datei in Blöcken von chunk_rows Zeilen.
+    
+    Gelesen werden nur location_id, location_name, product und die
+    Faktorspalten aus PRODUCT_FACTORS. Faktorspalten werden ohne
+    Typ-Inferenz als float64 geparst, product als Kategorie. Enthält eine
+    Faktorspalte Text, wird ab dem betroffenen Block mit inferierten Typen
+    weitergelesen (ungültige Werte zählen dann wie bisher als fehlend).
+    
+    Args:
+        source: Dateiobjekt oder Pfad der CSV-Datei
+        chunk_rows: Zeilen pro Block
+        
+    Yields:
+        Roh-DataFrame je Block
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as handle:
+            yield from iter_csv_chunks(handle, chunk_rows)
+        return
+    
+    start = source.tell()
+    header = pd.read_csv(source, nrows=0).columns
+    source.seek(start)
+    
+    factor_names = set(_scoring_config.factor_names)
+    usecols = scoring_columns(header)
+    dtype = {column: np.float64 for column in usecols if column in factor_names}
+    if "product" in usecols:
+        dtype["product"] = "category"
+    
+    emitted = 0
+    try:
+        with pd.read_csv(source, usecols=usecols, dtype=dtype, chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                yield chunk
+                emitted += 1
+    except ValueError:
+        # Nicht-numerischer Faktorwert: bereits gelieferte Blöcke überspringen
+        source.seek(start)
+        with pd.read_csv(source, usecols=usecols, chunksize=chunk_rows) as reader:
+            for index, chunk in enumerate(reader):
+                if index >= emitted:
+                    yield chunk
+
+
+# Dateiendungen für Arrow IPC (Datei- oder Stream-Format)
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+
+def check_upload_filename(filename: str) -> None:
+    """
+    Raises:
+        HTTPException: 400 bei nicht unterstütztem Dateiformat
+    """
+    if not filename.endswith(('.csv', '.xlsx', '.xls', '.parquet') + ARROW_EXTENSIONS):
+        raise HTTPException(
+            status_code=400,
+            detail="Ungültiges Dateiformat. Bitte CSV, Excel (.xlsx, .xls), Parquet oder Arrow (.arrow) hochladen."
+        )
+
+
+def import_pyarrow():
+    """
+    Importiert pyarrow erst bei Bedarf (optionale Abhängigkeit).
+    
+    Raises:
+        HTTPException: 501 wenn pyarrow nicht installiert ist
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise HTTPException(
+            status_code=501,
+            detail="Parquet/Arrow wird nicht unterstützt: Paket 'pyarrow' ist nicht installiert"
+        )
+    return pyarrow
+
+
+def iter_arrow_chunks(source, filename: str, chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Liest eine Parquet- oder Arrow-IPC-Datei in Blöcken von chunk_rows Zeilen.
+    
+    Es werden nur die Spalten aus scoring_columns gelesen. Die Typen kommen
+    aus dem Schema, es gibt kein Text-Parsing. Arrow-IPC-Blöcke sind
+    Ausschnitte der Record Batches ohne Kopie; float64-Spalten ohne
+    Nullwerte übernimmt pandas ebenfalls ohne Kopie.
+    
+    Args:
+        source: Dateiobjekt oder Pfad der Datei
+        filename: Dateiname in Kleinbuchstaben (.parquet oder ARROW_EXTENSIONS)
+        chunk_rows: Zeilen pro Block
+        
+    Yields:
+        Roh-DataFrame je Block
+    """
+    pa = import_pyarrow()
+    
+    try:
+        if filename.endswith('.parquet'):
+            parquet_file = pa.parquet.ParquetFile(source)
+            columns = scoring_columns(parquet_file.schema_arrow.names)
+            batches = parquet_file.iter_batches(batch_size=chunk_rows, columns=columns)
+        else:
+            try:
+                reader = pa.ipc.open_file(source)
+                batches = (reader.get_batch(index) for index in range(reader.num_record_batches))
+            except pa.ArrowInvalid:
+                # Kein Dateiformat: Arrow-Stream-Format versuchen
+                if hasattr(source, "seek"):
+                    source.seek(0)
+                reader = pa.ipc.open_stream(source)
+                batches = reader
+            columns = scoring_columns(reader.schema.names)
+        
+        for batch in batches:
+            batch = batch.select(columns)
+            for offset in range(0, batch.num_rows, chunk_rows):
+                yield batch.slice(offset, chunk_rows).to_pandas()
+    except pa.ArrowException as e:
+        raise HTTPException(status_code=400, detail=f"Ungültige Parquet/Arrow-Datei: {str(e)}")
+
+
+# Zellinhalte, die pandas beim Einlesen als fehlend wertet
+EXCEL_NA_STRINGS = frozenset([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+])
+
+_XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_XLSX_REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_PACKAGE_RELS_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def iter_excel_sheets(source, sheet_names: Optional[List[str]] = None) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """
+    Liest die Sheets einer .xlsx-Datei direkt aus dem Workbook-XML.
+    
+    Das Sheet-XML wird blockweise dekomprimiert und zeilenweise gelesen,
+    ohne Zellobjekte anzulegen. Übernommen werden nur location_id, location_name, product und die
+    Faktorspalten aus PRODUCT_FACTORS; Spalten wie address, region oder
+    notes werden nie umgewandelt. Faktorspalten entstehen direkt als
+    float64, die übrigen Spalten werden wie bei pd.read_excel typisiert.
+    
+    Args:
+        source: Dateiobjekt oder Pfad der .xlsx-Datei
+        sheet_names: Zu lesende Sheets (Standard: alle außer Info-Sheets)
+        
+    Yields:
+        Tuple (sheet_name, DataFrame) je Sheet
+    """
+    with zipfile.ZipFile(source) as archive:
+        workbook_path = _xlsx_workbook_path(archive)
+        sheet_paths, date1904 = _xlsx_sheet_paths(archive, workbook_path)
+        shared_strings = _xlsx_shared_strings(archive, workbook_path)
+        date_styles = _xlsx_date_styles(archive, workbook_path)
+        
+        if sheet_names is None:
+            sheet_names = [name for name in sheet_paths if name.lower() not in INFO_SHEET_NAMES]
+        
+        for sheet_name in sheet_names:
+            with archive.open(sheet_paths[sheet_name]) as stream:
+                yield sheet_name, _read_sheet_xml(stream, sheet_name, shared_strings, date_styles, date1904)
+
+
+def _xlsx_part_path(base_path: str, target: str) -> str:
+    """Löst ein Beziehungsziel relativ zum Verzeichnis von base_path auf."""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_path), target))
+
+
+def _xlsx_relationships(archive: zipfile.ZipFile, part_path: str) -> Dict[str, Tuple[str, str]]:
+    """Beziehungen eines Teils: Id -> (Typ, Pfad)."""
+    rels_path = posixpath.join(posixpath.dirname(part_path), "_rels", posixpath.basename(part_path) + ".rels")
+    if rels_path not in archive.namelist():
+        return {}
+    root = ElementTree.fromstring(archive.read(rels_path))
+    return {
+        rel.get("Id"): (rel.get("Type", "").rsplit("/", 1)[-1], _xlsx_part_path(part_path, rel.get("Target", "")))
+        for rel in root.iter(f"{_PACKAGE_RELS_NS}Relationship")
+    }
+
+
+def _xlsx_workbook_path(archive: zipfile.ZipFile) -> str:
+    """Pfad des Workbook-Teils laut _rels/.rels."""
+    for rel_type, path in _xlsx_relationships(archive, "").values():
+        if rel_type == "officeDocument":
+            return path
+    return "xl/workbook.xml"
+
+
+def _xlsx_sheet_paths(archive: zipfile.ZipFile, workbook_path: str) -> Tuple[Dict[str, str], bool]:
+    """
+    Sheet-Namen in Workbook-Reihenfolge mit Pfad des Sheet-XML.
+    
+    Returns:
+        Tuple (Name -> Pfad, date1904)
+    """
+    relationships = _xlsx_relationships(archive, workbook_path)
+    root = ElementTree.fromstring(archive.read(workbook_path))
+    
+    properties = root.find(f"{_XLSX_NS}workbookPr")
+    date1904 = properties is not None and properties.get("date1904") in ("1", "true")
+    
+    sheet_paths = {}
+    for sheet in root.iter(f"{_XLSX_NS}sheet"):
+        rel_type, path = relationships[sheet.get(_XLSX_REL_ID)]
+        if rel_type == "worksheet":
+            sheet_paths[sheet.get("name")] = path
+    return sheet_paths, date1904
+
+
+def _xlsx_shared_strings(archive: zipfile.ZipFile, workbook_path: str) -> List[str]:
+    """Shared Strings des Workbooks (Rich Text zusammengefügt, ohne Phonetik)."""
+    path = next(
+        (path for rel_type, path in _xlsx_relationships(archive, workbook_path).values() if rel_type == "sharedStrings"),
+        None,
+    )
+    if path is None or path not in archive.namelist():
+        return []
+    
+    strings = []
+    with archive.open(path) as stream:
+        for _, element in ElementTree.iterparse(stream):
+            if element.tag != f"{_XLSX_NS}si":
+                continue
+            text = element.find(f"{_XLSX_NS}t")
+            if text is not None:
+                strings.append(text.text or "")
+            else:
+                strings.append("".join(run.text or "" for run in element.iterfind(f"{_XLSX_NS}r/{_XLSX_NS}t")))
+            element.clear()
+    return strings
+
+
+def _xlsx_date_styles(archive: zipfile.ZipFile, workbook_path: str) -> Dict[int, bool]:
+    """
+    Zellstile mit Datums- oder Zeitformat.
+    
+    Returns:
+        Stil-Index -> True bei Zeitdauer-Format, False bei Datumsformat
+    """
+    path = next(
+        (path for rel_type, path in _xlsx_relationships(archive, workbook_path).values() if rel_type == "styles"),
+        None,
+    )
+    if path is None or path not in archive.namelist():
+        return {}
+    
+    from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+    
+    root = ElementTree.fromstring(archive.read(path))
+    formats = dict(BUILTIN_FORMATS)
+    for number_format in root.iter(f"{_XLSX_NS}numFmt"):
+        formats[int(number_format.get("numFmtId"))] = number_format.get("formatCode", "")
+    
+    date_styles = {}
+    cell_formats = root.find(f"{_XLSX_NS}cellXfs")
+    for index, cell_format in enumerate(cell_formats if cell_formats is not None else []):
+        code = formats.get(int(cell_format.get("numFmtId", 0)))
+        if code and is_date_format(code):
+            date_styles[index] = is_timedelta_format(code)
+    return date_styles
+
+
+def _xlsx_column_index(reference: str) -> int:
+    """Spaltenindex (0-basiert) aus einer Zellreferenz wie "AB12"."""
+    index = 0
+    for char in reference:
+        if char.isdigit():
+            break
+        index = index * 26 + (ord(char.upper()) - 64)
+    return index - 1
+
+
+_XLSX_SHEET_DATA = re.compile(r"<(\w+:)?sheetData\b")
+_XLSX_CELL = re.compile(r"<(?:\w+:)?c\b([^>]*?)(?:/>|>(.*?)</(?:\w+:)?c>)", re.S)
+_XLSX_ATTRIBUTE = re.compile(r'\b([rts])="([^"]*)"')
+_XLSX_VALUE = re.compile(r"<(?:\w+:)?v>(.*?)</(?:\w+:)?v>", re.S)
+_XLSX_TEXT = re.compile(r"<(?:\w+:)?t(?:\s[^>]*)?>(.*?)</(?:\w+:)?t>", re.S)
+_XLSX_PHONETIC = re.compile(r"<(?:\w+:)?rPh\b.*?</(?:\w+:)?rPh>", re.S)
+_XLSX_HAS_VALUE = re.compile(r"<(?:\w+:)?(?:v|is)>")
+
+# Dekomprimierte Bytes pro Leseschritt aus dem Sheet-XML
+XLSX_READ_BYTES = 4 * 1024 * 1024
+
+
+def _xlsx_cell_pattern(prefix: str, letters: List[str], reference_first: bool) -> "re.Pattern":
+    """
+    Muster für die Zellen der Spalten `letters`.
+    
+    Steht die Referenz wie bei Excel, openpyxl und XlsxWriter als erstes
+    Attribut, reicht ein Muster mit festem Präfix; sonst wird die
+    Referenz per Lookahead gesucht (deutlich langsamer).
+    """
+    columns = "|".join(letters)
+    cell = re.escape(prefix) + "c"
+    if reference_first:
+        return re.compile(f'<{cell} r="({columns})\\d+"([^>]*?)(?:/>|>(.*?)</{cell}>)', re.S)
+    return re.compile(f'<{cell}\\s(?=[^>]*?\\br="({columns})\\d)([^>]*?)(?:/>|>(.*?)</{cell}>)', re.S)
+
+
+class _XlsxCells:
+    """Wandelt Zellen eines Sheets wie openpyxl im Read-only-Modus (data_only) in Werte um."""
+    
+    def __init__(self, shared_strings: List[str], date_styles: Dict[int, bool], date1904: bool):
+        from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+        
+        self.shared_strings = shared_strings
+        self.date_styles = date_styles
+        self.epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+        self.from_excel = from_excel
+        # Attribut-Strings wiederholen sich fast immer (' t="n"', ' s="3" t="s"')
+        self.kinds: Dict[str, Tuple[str, Optional[bool]]] = {}
+    
+    def kind(self, attributes: str) -> Tuple[str, Optional[bool]]:
+        """Zelltyp und Datumsformat (None, False = Datum, True = Dauer) aus den Attributen"""
+        kind = self.kinds.get(attributes)
+        if kind is None:
+            cell_attributes = dict(_XLSX_ATTRIBUTE.findall(attributes))
+            style = cell_attributes.get("s")
+            kind = (cell_attributes.get("t", "n"), self.date_styles.get(int(style)) if style else None)
+            self.kinds[attributes] = kind
+        return kind
+    
+    def value(self, attributes: str, content: Optional[str]) -> object:
+        if not content:
+            return None
+        
+        cell_type, timedelta = self.kind(attributes)
+        
+        if cell_type == "inlineStr":
+            if "rPh" in content:
+                content = _XLSX_PHONETIC.sub("", content)
+            text = "".join(_XLSX_TEXT.findall(content))
+            return html.unescape(text) if "&" in text else text
+        
+        match = _XLSX_VALUE.search(content)
+        value = match.group(1) if match else None
+        if not value:
+            return None
+        if cell_type == "s":
+            return self.shared_strings[int(value)]
+        if cell_type == "b":
+            return value == "1"
+        if cell_type in ("str", "e", "d"):
+            return html.unescape(value) if "&" in value else value
+        
+        number = float(value) if ("." in value or "E" in value or "e" in value) else int(value)
+        if timedelta is not None:
+            return self.from_excel(number, self.epoch, timedelta=timedelta)
+        return number
+
+
+def _iter_xlsx_rows(stream) -> Iterator[str]:
+    """
+    Streamt den Inhalt der <row>-Elemente eines Sheet-XML.
+    
+    Das XML wird blockweise dekomprimiert und an den schließenden
+    Row-Tags geteilt; die unvollständige letzte Zeile eines Blocks wird
+    in den nächsten Block übernommen.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    open_tag = close_tag = None
+    while True:
+        block = stream.read(XLSX_READ_BYTES)
+        pending += decoder.decode(block, final=not block)
+        
+        if open_tag is None:
+            match = _XLSX_SHEET_DATA.search(pending)
+            if match is None:
+                if not block:
+                    return
+                continue
+            prefix = match.group(1) or ""
+            open_tag, close_tag = f"<{prefix}row", f"</{prefix}row>"
+        
+        parts = pending.split(close_tag)
+        pending = parts.pop()
+        for part in parts:
+            # Vorangehende leere <row/>-Elemente enthalten keine Zellen
+            start = part.rfind(open_tag)
+            yield part[part.index(">", start) + 1:]
+        
+        if not block:
+            return
+
+
+def _read_sheet_xml(stream, sheet_name: str, shared_strings: List[str], date_styles: Dict[int, bool],
+                    date1904: bool) -> pd.DataFrame:
+    """
+    Baut ein DataFrame mit den scoring-relevanten Spalten eines Sheet-XML.
+    
+    Die erste Zeile des Sheets ist die Kopfzeile (wie pd.read_excel mit
+    header=0); ist sie leer, hat das Sheet keine bekannten Spalten. Leere
+    Zeilen danach werden übersprungen. Nach der Kopfzeile sucht ein
+    reguläres Muster nur noch die Zellen der benötigten Spalten, alle
+    anderen Zellen werden nie ausgewertet.
+    """
+    factor_names = set(_scoring_config.factor_names)
+    wanted = {"location_id", "location_name", "product"} | factor_names
+    cells = _XlsxCells(shared_strings, date_styles, date1904)
+    
+    rows = _iter_xlsx_rows(stream)
+    first_row = next(rows, None)
+    if first_row is None:
+        return pd.DataFrame()
+    
+    # Kopfzeile: erste Zeile des Sheets, auch wenn sie leer ist
+    header = {}
+    position = 0
+    reference_first = True
+    for attributes, content in _XLSX_CELL.findall(first_row):
+        reference = dict(_XLSX_ATTRIBUTE.findall(attributes)).get("r")
+        reference_first = reference_first and attributes.startswith(f' r="{reference}"')
+        position = _xlsx_column_index(reference) if reference else position
+        header[position] = (reference, cells.value(attributes, content))
+        position += 1
+    first_reference = next((reference for reference, _ in header.values() if reference), None)
+    if first_reference is not None and first_reference.lstrip("$ABCDEFGHIJKLMNOPQRSTUVWXYZ") != "1":
+        # Zeile 1 fehlt im XML: Sie ist leer, die gelesene Zeile gehört zu den Daten
+        header = {}
+        rows = itertools.chain([first_row], rows)
+    
+    columns_by_position = {}
+    for position in sorted(header):
+        name = header[position][1]
+        if isinstance(name, str) and name in wanted and name not in columns_by_position.values():
+            columns_by_position[position] = name
+    
+    values = {name: [] for name in columns_by_position.values()}
+    row_count = 0
+    
+    if columns_by_position and all(header[position][0] for position in columns_by_position):
+        columns_by_letters = {
+            header[position][0].rstrip("0123456789"): name for position, name in columns_by_position.items()
+        }
+        prefix = re.match(r"<(\w+:)?", first_row.lstrip()).group(1) or ""
+        cell_pattern = _xlsx_cell_pattern(prefix, list(columns_by_letters), reference_first)
+        for row in rows:
+            row_cells = {letters: cells.value(attributes, content)
+                         for letters, attributes, content in cell_pattern.findall(row)}
+            if all(value is None for value in row_cells.values()) and not _XLSX_HAS_VALUE.search(row):
+                continue
+            row_count += 1
+            for letters, name in columns_by_letters.items():
+                values[name].append(row_cells.get(letters))
+    else:
+        # Zellen ohne Referenz: Position wie openpyxl fortzählen
+        for row in rows:
+            row_cells = {}
+            position = 0
+            for attributes, content in _XLSX_CELL.findall(row):
+                reference = dict(_XLSX_ATTRIBUTE.findall(attributes)).get("r")
+                position = _xlsx_column_index(reference) if reference else position
+                row_cells[position] = cells.value(attributes, content)
+                position += 1
+            if all(value is None for value in row_cells.values()):
+                continue
+            row_count += 1
+            for position, name in columns_by_position.items():
+                values[name].append(row_cells.get(position))
+    
+    if row_count and not values:
+        # Daten ohne eine einzige bekannte Spalte
+        validate_columns([], sheet_name, detect_sheet_product(sheet_name))
+    
+    return _typed_columns(values, row_count, factor_names)
+
+
+def _typed_columns(values: Dict[str, list], row_count: int, factor_names) -> pd.DataFrame:
+    """
+    Typisiert die eingelesenen Spalten: Faktoren als float64, die übrigen
+    Spalten wie bei pd.read_excel (fehlende Werte als NaN, rein numerische
+    Spalten als Zahlen).
+    """
+    columns = {}
+    for name, column in values.items():
+        if name in factor_names:
+            columns[name] = _factor_column_values(pd.Series(column, dtype=object))
+            continue
+        
+        series = pd.Series(column, dtype=object)
+        series = series.mask(series.isna() | series.isin(EXCEL_NA_STRINGS), np.nan)
+        if name != "product":
+            # pd.read_excel liefert ganzzahlige Gleitkommazahlen als int
+            series = series.map(lambda value: int(value) if isinstance(value, float) and value.is_integer() else value)
+            try:
+                series = pd.to_numeric(series)
+            except (ValueError, TypeError):
+                pass
+        columns[name] = series.to_numpy()
+    
+    return pd.DataFrame(columns, index=pd.RangeIndex(row_count))
+
+
+def iter_upload_results(source, filename: str,
+                        progress: Optional[Callable[[int, int], None]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Bewertet eine hochgeladene CSV-, Excel-, Parquet- oder Arrow-Datei Block für Block.
+    
+    Args:
+        source: Dateiobjekt des Uploads (am Anfang positioniert)
+        filename: Dateiname in Kleinbuchstaben
+        progress: Optional, wird je Block mit (gelesene, bewertete Zeilen) aufgerufen
+        
+    Yields:
+        Ergebnis-DataFrame je CSV-Block bzw. Excel-Sheet
+    """
+    if filename.endswith('.csv'):
+        # CSV: Eine Datei mit product-Spalte, blockweise gelesen
+        yield from iter_csv_results(source, "CSV", progress=progress)
+        return
+    
+    if filename.endswith('.parquet') or filename.endswith(ARROW_EXTENSIONS):
+        # Parquet / Arrow IPC: typisierte Spalten, eine Tabelle mit product-Spalte
+        source_name = "Parquet" if filename.endswith('.parquet') else "Arrow"
+        for chunk in metrics.timed(iter_arrow_chunks(source, filename), "parse"):
+            yield score_chunk(chunk, source_name, progress=progress)
+        return
+    
+    if filename.endswith('.xlsx'):
+        # Read-only-Pfad: nur scoring-relevante Spalten
+        for sheet_name, df in metrics.timed(iter_excel_sheets(source), "parse"):
+            yield score_chunk(df, sheet_name, detect_sheet_product(sheet_name), progress)
+        return
+    
+    # Excel (.xls): Mehrere Sheets möglich
+    with metrics.timer("parse"):
+        excel_file = pd.ExcelFile(source)
+    
+    # Verarbeite jedes Sheet
+    for sheet_name in excel_file.sheet_names:
+        # Überspringe Info-Sheets
+        if sheet_name.lower() in INFO_SHEET_NAMES:
+            continue
+        
+        with metrics.timer("parse"):
+            df = pd.read_excel(excel_file, sheet_name=sheet_name)
+        
+        # Versuche Produkt aus Sheet-Namen zu ermitteln
+        sheet_product = detect_sheet_product(sheet_name)
+        
+        yield score_chunk(df, sheet_name, sheet_product, progress)
+
+
+async def aiter_upload_results(source, filename: str) -> AsyncIterator[pd.DataFrame]:
+    """
+    Bewertet einen Upload im Prozess-Pool (falls aktiviert) oder im
+    Thread-Pool von blocking_work.
+    
+    Excel-Sheets und große CSV-Dateien werden als einzelne Aufgaben an den
+    Prozess-Pool verteilt; die Ergebnisse kommen in Sheet- bzw.
+    Dateireihenfolge zurück. In beiden Fällen bleibt die Event-Loop frei.
+    
+    Args:
+        source: Dateiobjekt des Uploads (am Anfang positioniert)
+        filename: Dateiname in Kleinbuchstaben
+        
+    Yields:
+        Ergebnis-DataFrame je CSV-Block, CSV-Bereich bzw. Excel-Sheet
+    """
+    pool = get_scoring_pool()
+    
+    if pool is not None and filename.endswith(('.xlsx', '.xls')):
+        parallel = True
+    elif pool is not None and filename.endswith('.csv'):
+        source.seek(0, os.SEEK_END)
+        parallel = source.tell() >= PARALLEL_CSV_MIN_BYTES
+        source.seek(0)
+    else:
+        parallel = False
+    
+    futures = await blocking_work.run(submit_upload_tasks, pool, source, filename) if parallel else None
+    
+    if futures is None:
+        # Jeder Block wird im Thread-Pool gelesen und bewertet
+        iterator = iter_upload_results(source, filename)
+        while True:
+            result = await blocking_work.run(next, iterator, None)
+            if result is None:
+                return
+            yield result
+    
+    try:
+        for future in futures:
+            try:
+                yield await asyncio.wrap_future(future)
+            except UploadRejected as e:
+                raise HTTPException(status_code=e.status_code, detail=e.detail)
+    finally:
+        # Bei Fehlern oder Abbruch keine weiteren Teile mehr bewerten
+        for future in futures:
+            future.cancel()
+
+
+# Threads für blockierende pandas-/openpyxl-Arbeit der Request-Handler
+SCORING_THREADS = int(os.environ.get("SCORING_THREADS", str(min(4, os.cpu_count() or 1))))
+
+# Anfragen, die zusätzlich auf einen freien Thread warten dürfen; darüber 503
+SCORING_QUEUE_LIMIT = int(os.environ.get("SCORING_QUEUE_LIMIT", "16"))
+
+# Retry-After (Sekunden) für abgewiesene Anfragen
+SCORING_RETRY_AFTER_SECONDS = 5
+
+
+class BlockingWorkLimiter:
+    """
+    Begrenzter Thread-Pool für blockierende Arbeit aus async-Handlern.
+    
+    Jede Anfrage belegt für ihre gesamte Dauer einen Platz (admit).
+    Höchstens max_workers Anfragen arbeiten gleichzeitig, bis zu max_queued
+    warten auf einen Thread; weitere werden sofort mit 503 und Retry-After
+    abgewiesen. Parsing, Scoring und Serialisierung laufen über run() im
+    Pool, die Event-Loop bleibt für kleine Anfragen frei.
+    """
+    
+    def __init__(self, max_workers: int, max_queued: int):
+        self.max_workers = max(1, max_workers)
+        self.max_queued = max(0, max_queued)
+        self.active = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="scoring")
+            return self._executor
+    
+    def admit(self) -> Callable[[], None]:
+        """
+        Reserviert einen Platz für eine Anfrage.
+        
+        Returns:
+            Funktion zum Freigeben des Platzes (mehrfacher Aufruf ist harmlos)
+            
+        Raises:
+            HTTPException: 503 wenn alle Plätze belegt sind
+        """
+        with self.lock:
+            if self.active >= self.max_workers + self.max_queued:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server ausgelastet, bitte später erneut versuchen",
+                    headers={"Retry-After": str(SCORING_RETRY_AFTER_SECONDS)},
+                )
+            self.active += 1
+        
+        released = threading.Event()
+        
+        def release():
+            with self.lock:
+                if not released.is_set():
+                    released.set()
+                    self.active -= 1
+        
+        return release
+    
+    async def run(self, func, *args):
+        """Führt func(*args) im Pool aus (mit den contextvars des Aufrufers, ggf. profiliert)."""
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, run_profiled, func, *args))
+    
+    def shutdown(self) -> None:
+        with self.lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+blocking_work = BlockingWorkLimiter(SCORING_THREADS, SCORING_QUEUE_LIMIT)
+
+
+async def release_after(stream: AsyncIterator[bytes], release: Callable[[], None]) -> AsyncIterator[bytes]:
+    """Gibt den Platz einer Streaming-Antwort erst nach dem letzten Stück frei."""
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        release()
+
+
+# Worker-Prozesse für Excel-Sheets und große CSV-Dateien (0 = deaktiviert)
+SCORING_PROCESS_WORKERS = int(os.environ.get("SCORING_PROCESS_WORKERS", "0"))
+
+# CSV-Dateien ab dieser Größe werden im Pool nach Zeilenbereichen aufgeteilt
+PARALLEL_CSV_MIN_BYTES = 32 * 1024 * 1024
+
+# Maximale Größe eines CSV-Bereichs pro Worker-Aufgabe
+CSV_PART_BYTES = 64 * 1024 * 1024
+
+_scoring_pool: Optional[ProcessPoolExecutor] = None
+
+
+class UploadRejected(Exception):
+    """Picklebare Form einer HTTPException aus einem Worker-Prozess"""
+    
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def get_scoring_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Liefert den Prozess-Pool für das Bewerten von Uploads.
+    
+    Die Größe wird über die Umgebungsvariable SCORING_PROCESS_WORKERS
+    festgelegt; bei 0 (Standard) wird alles im Prozess bewertet.
+    """
+    global _scoring_pool
+    
+    if SCORING_PROCESS_WORKERS < 1:
+        return None
+    if _scoring_pool is None:
+        # spawn statt fork: der Server-Prozess läuft mit mehreren Threads
+        _scoring_pool = ProcessPoolExecutor(
+            max_workers=SCORING_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _scoring_pool
+
+
+@app.on_event("shutdown")
+def shutdown_scoring_pool():
+    """Beendet Prozess-Pool, Thread-Pool und Job-Worker beim Herunterfahren des Servers."""
+    global _scoring_pool
+    
+    if _scoring_pool is not None:
+        _scoring_pool.shutdown(wait=False, cancel_futures=True)
+        _scoring_pool = None
+    
+    blocking_work.shutdown()
+    scoring_jobs.shutdown()
+
+
+def _score_excel_sheet(path: str, sheet_name: str, sheet_product: Optional[str], xlsx: bool) -> pd.DataFrame:
+    """Worker-Aufgabe: liest und bewertet ein einzelnes Excel-Sheet."""
+    try:
+        if xlsx:
+            _, df = next(iter_excel_sheets(path, [sheet_name]))
+        else:
+            df = pd.read_excel(path, sheet_name=sheet_name)
+        return score_dataframe(df, sheet_name, default_product=sheet_product)
+    except HTTPException as e:
+        raise UploadRejected(e.status_code, e.detail)
+
+
+def _score_csv_part(path: str, start: int, end: int) -> pd.DataFrame:
+    """
+    Worker-Aufgabe: bewertet die Zeilen im Byte-Bereich [start, end) einer
+    CSV-Datei. Die Kopfzeile wird jedem Bereich vorangestellt.
+    """
+    with open(path, "rb") as handle:
+        header = handle.readline()
+        handle.seek(start)
+        data = handle.read(end - start)
+    
+    try:
+        parts = [score_dataframe(chunk, "CSV") for chunk in iter_csv_chunks(io.BytesIO(header + data))]
+    except HTTPException as e:
+        raise UploadRejected(e.status_code, e.detail)
+    
+    return concat_results(parts) if parts else score_dataframe(pd.DataFrame(), "CSV")
+
+
+def _csv_part_ranges(path: str) -> Optional[List[Tuple[int, int]]]:
+    """
+    Teilt eine CSV-Datei an Zeilenenden in Byte-Bereiche auf.
+    
+    Returns:
+        Liste von (start, end) ohne Kopfzeile, oder None wenn die Datei
+        Anführungszeichen enthält (Felder könnten Zeilenumbrüche enthalten)
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    
+    with open(path, "rb") as handle:
+        # Mehrzeilige Felder sind nur in Anführungszeichen möglich
+        while True:
+            block = handle.read(1024 * 1024)
+            if not block:
+                break
+            if b'"' in block:
+                return None
+        
+        handle.seek(0)
+        start = len(handle.readline())
+        while start < size:
+            handle.seek(min(start + CSV_PART_BYTES, size))
+            handle.readline()
+            end = min(handle.tell(), size)
+            ranges.append((start, end))
+            start = end
+    
+    return ranges
+
+
+def _copy_upload(source, filename: str) -> str:
+    """Kopiert den Upload in eine temporäre Datei, die Worker öffnen können."""
+    source.seek(0)
+    suffix = os.path.splitext(filename)[1]
+    with tempfile.NamedTemporaryFile(prefix="upload_", suffix=suffix, delete=False) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    return target.name
+
+
+def _remove_when_done(futures: List[Future], path: str) -> None:
+    """Löscht die temporäre Datei, sobald alle Aufgaben beendet sind."""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    
+    def on_done(_future):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                os.unlink(path)
+    
+    for future in futures:
+        future.add_done_callback(on_done)
+
+
+def submit_upload_tasks(pool: ProcessPoolExecutor, source, filename: str) -> Optional[List[Future]]:
+    """
+    Verteilt einen Upload als Aufgaben auf den Prozess-Pool.
+    
+    Excel: eine Aufgabe pro Sheet. CSV: eine Aufgabe pro Byte-Bereich von
+    höchstens CSV_PART_BYTES.
+    
+    Returns:
+        Futures in Sheet- bzw. Dateireihenfolge, oder None wenn die Datei
+        nicht aufgeteilt werden kann
+    """
+    path = _copy_upload(source, filename)
+    
+    try:
+        if filename.endswith('.csv'):
+            ranges = _csv_part_ranges(path)
+            if ranges is None:
+                os.unlink(path)
+                source.seek(0)
+                return None
+            futures = [pool.submit(_score_csv_part, path, start, end) for start, end in ranges]
+        else:
+            sheet_names = pd.ExcelFile(path).sheet_names
+            futures = [
+                pool.submit(
+                    _score_excel_sheet, path, sheet_name, detect_sheet_product(sheet_name), filename.endswith('.xlsx')
+                )
+                for sheet_name in sheet_names
+                if sheet_name.lower() not in INFO_SHEET_NAMES
+            ]
+    except Exception:
+        os.unlink(path)
+        raise
+    
+    if not futures:
+        os.unlink(path)
+        return futures
+    
+    _remove_when_done(futures, path)
+    return futures
+
+
+# Ergebnis-Cache für wiederholte Uploads: Speicher-Obergrenze (0 = deaktiviert)
+SCORING_CACHE_BYTES = int(os.environ.get("SCORING_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+# Optionales Verzeichnis für die Festplatten-Stufe des Caches
+SCORING_CACHE_DIR = os.environ.get("SCORING_CACHE_DIR") or None
+
+# Obergrenze der Festplatten-Stufe
+SCORING_CACHE_DISK_BYTES = int(os.environ.get("SCORING_CACHE_DISK_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# Blockgröße beim Hashen des Uploads
+UPLOAD_HASH_BYTES = 1024 * 1024
+
+
+def _frame_bytes(frame: pd.DataFrame) -> int:
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+class UploadResultCache:
+    """
+    Ergebnisse bereits bewerteter Uploads, adressiert über den Dateiinhalt.
+    
+    Der Schlüssel besteht aus dem Fingerprint von PRODUCT_FACTORS, dem
+    Dateityp und dem SHA-256 der hochgeladenen Bytes. Gespeichert wird das
+    Ergebnis von score_dataframe in Dateireihenfolge, sodass top_k,
+    per_product und alle Ausgabeformate daraus bedient werden. Ändert sich
+    die Faktorkonfiguration, werden alle Einträge verworfen.
+    
+    Stufen: LRU im Speicher (max_bytes) und optional Pickle-Dateien in
+    `directory` (max_disk_bytes, älteste zuerst gelöscht).
+    """
+    
+    def __init__(self, max_bytes: int, directory: Optional[str] = None, max_disk_bytes: int = 0):
+        self.memory = LRUCache(max_bytes=max_bytes, sizeof=_frame_bytes)
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.fingerprint = None
+        self.lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    
+    @property
+    def enabled(self) -> bool:
+        return self.memory.max_bytes > 0
+    
+    def key(self, source, filename: str) -> str:
+        """Cache-Schlüssel für einen Upload (Dateiobjekt wird zurückgespult)."""
+        digest = hashlib.sha256()
+        with metrics.timer("hash"):
+            source.seek(0)
+            for block in iter(lambda: source.read(UPLOAD_HASH_BYTES), b""):
+                digest.update(block)
+            source.seek(0)
+        
+        kind = os.path.splitext(filename)[1].lstrip(".")
+        return f"{_scoring_config.fingerprint[:16]}-{kind}-{digest.hexdigest()}"
+    
+    def _check_fingerprint(self) -> None:
+        """Verwirft alle Einträge, wenn sich PRODUCT_FACTORS geändert hat."""
+        fingerprint = _scoring_config.fingerprint
+        if self.fingerprint == fingerprint:
+            return
+        with self.lock:
+            if self.fingerprint == fingerprint:
+                return
+            self.memory.clear()
+            for path in self._disk_entries():
+                if not os.path.basename(path).startswith(fingerprint[:16]):
+                    self._remove(path)
+            self.fingerprint = fingerprint
+    
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        if not self.enabled:
+            return None
+        self._check_fingerprint()
+        
+        result = self.memory.get(key)
+        if result is not None or not self.directory:
+            return result
+        
+        path = os.path.join(self.directory, f"{key}.pkl")
+        try:
+            result = pd.read_pickle(path)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        os.utime(path)
+        self.memory.put(key, result)
+        return result
+    
+    def put(self, key: str, result: pd.DataFrame) -> None:
+        if not self.enabled:
+            return
+        self._check_fingerprint()
+        if not key.startswith(self.fingerprint[:16]):
+            # Konfiguration hat sich während der Bewertung geändert
+            return
+        
+        self.memory.put(key, result)
+        if self.directory:
+            path = os.path.join(self.directory, f"{key}.pkl")
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            result.to_pickle(temporary)
+            os.replace(temporary, path)
+            self._prune_disk()
+    
+    async def collect(self, key: str, results: AsyncIterator[pd.DataFrame]) -> AsyncIterator[pd.DataFrame]:
+        """
+        Reicht Ergebnisblöcke durch und speichert sie nach dem letzten Block.
+        
+        Bricht die Bewertung ab oder wird das Ergebnis größer als der
+        Cache, wird nichts gespeichert.
+        """
+        parts: Optional[List[pd.DataFrame]] = []
+        size = 0
+        async for result in results:
+            if parts is not None:
+                size += _frame_bytes(result)
+                if size <= self.memory.max_bytes:
+                    parts.append(result)
+                else:
+                    parts = None
+            yield result
+        
+        if parts:
+            await blocking_work.run(self._store, key, parts)
+    
+    def _store(self, key: str, parts: List[pd.DataFrame]) -> None:
+        result = concat_results(parts)
+        if len(result):
+            self.put(key, result)
+    
+    def _disk_entries(self) -> List[str]:
+        if not self.directory:
+            return []
+        return [entry.path for entry in os.scandir(self.directory) if entry.name.endswith(".pkl")]
+    
+    def _remove(self, path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    
+    def _prune_disk(self) -> None:
+        """Löscht die am längsten nicht genutzten Dateien über max_disk_bytes."""
+        entries = []
+        for path in self._disk_entries():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            self._remove(path)
+            total -= size
+    
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        stats["disk_entries"] = len(self._disk_entries())
+        return stats
+
+
+upload_cache = UploadResultCache(SCORING_CACHE_BYTES, SCORING_CACHE_DIR, SCORING_CACHE_DISK_BYTES)
+
+
+async def _aiter_frames(frames: List[pd.DataFrame]) -> AsyncIterator[pd.DataFrame]:
+    for frame in frames:
+        yield frame
+
+
+# Threads für Hintergrund-Jobs (getrennt vom Thread-Pool der Request-Handler)
+SCORING_JOB_WORKERS = int(os.environ.get("SCORING_JOB_WORKERS", "2"))
+
+# Jobs, die zusätzlich auf einen freien Worker warten dürfen; darüber 503
+SCORING_JOB_QUEUE_LIMIT = int(os.environ.get("SCORING_JOB_QUEUE_LIMIT", "32"))
+
+# Ablage für Uploads, Status und Ergebnisse der Jobs
+SCORING_JOBS_DIR = os.environ.get("SCORING_JOBS_DIR") or os.path.join(tempfile.gettempdir(), "scoring_jobs")
+
+# Abgeschlossene Jobs werden nach dieser Zeit (Sekunden) gelöscht
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", str(24 * 60 * 60)))
+
+# Standard- und Maximalgröße einer Ergebnisseite
+JOB_PAGE_SIZE = 1_000
+JOB_MAX_PAGE_SIZE = 10_000
+
+# Geladene Job-Ergebnisse, die für weitere Seiten im Speicher bleiben
+JOB_RESULT_CACHE_BYTES = 64 * 1024 * 1024
+
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+JOB_FINISHED = ("done", "failed")
+
+
+_PROCESS_INSTANCES: Dict[int, str] = {}
+
+
+def _process_start_time(pid: int) -> Optional[str]:
+    """Startzeitpunkt eines Prozesses (Ticks seit Systemstart) aus /proc, sonst None."""
+    try:
+        with open(f"/proc/{pid}/stat", encoding="ascii", errors="replace") as source:
+            fields = source.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    # Feld 22 (starttime); der Befehlsname in Klammern kann Leerzeichen enthalten
+    return fields[19] if len(fields) > 19 else None
+
+
+def process_instance() -> str:
+    """
+    Kennung dieses Server-Prozesses: PID und Startzeitpunkt.
+    
+    Die PID allein reicht nicht, da ein neu gestarteter Server im Container
+    meist wieder dieselbe PID bekommt. Ohne /proc dient eine zufällige ID
+    als Ersatz; sie wird je PID erzeugt, damit per fork gestartete Worker
+    nicht die Kennung des Elternprozesses erben.
+    """
+    pid = os.getpid()
+    instance = _PROCESS_INSTANCES.get(pid)
+    if instance is None:
+        started = _process_start_time(pid)
+        instance = f"{pid}:{started}" if started else f"{pid}:{uuid.uuid4().hex}"
+        _PROCESS_INSTANCES[pid] = instance
+    return instance
+
+
+def _process_alive(pid: int, instance: Optional[str]) -> bool:
+    """Prüft, ob der Server-Prozess mit dieser PID und Kennung noch läuft."""
+    if instance is None:
+        # Status einer älteren Server-Version, die nicht mehr läuft
+        return False
+    if instance == process_instance():
+        return True
+    started = _process_start_time(pid)
+    if started is not None:
+        return instance == f"{pid}:{started}"
+    if not instance.startswith(f"{pid}:"):
+        return False
+    # Ohne /proc lässt sich nur prüfen, ob ein eigener Prozess mit der PID existiert
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+class JobStore:
+    """
+    Dateibasierte Ablage für Scoring-Jobs.
+    
+    Jeder Job hat ein eigenes Verzeichnis mit dem Upload, status.json
+    (atomar per os.replace geschrieben) und nach Abschluss der sortierten
+    Rangliste als results.pkl. Da alles im Dateisystem liegt, können Status
+    und Ergebnisse von jedem Server-Prozess gelesen und Jobs von jedem
+    Prozess gelöscht werden.
+    """
+    
+    def __init__(self, directory: str, retention_seconds: int, result_cache_bytes: int):
+        self.directory = directory
+        self.retention_seconds = retention_seconds
+        self.results = LRUCache(max_bytes=result_cache_bytes, sizeof=_frame_bytes)
+    
+    def path(self, job_id: str, name: str = "") -> str:
+        return os.path.join(self.directory, job_id, name)
+    
+    def create(self, source, filename: str, options: dict) -> dict:
+        """Legt einen Job an und kopiert den Upload in sein Verzeichnis."""
+        self.prune()
+        job_id = uuid.uuid4().hex
+        upload = "upload" + os.path.splitext(filename)[1]
+        os.makedirs(self.path(job_id))
+        
+        source.seek(0)
+        with open(self.path(job_id, upload), "wb") as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        
+        status = {
+            "job_id": job_id,
+            "status": "queued",
+            "filename": filename,
+            "upload": upload,
+            "options": options,
+            "pid": os.getpid(),
+            "instance": process_instance(),
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "progress": {"rows_parsed": 0, "rows_scored": 0, "rows_skipped": 0},
+            "result_count": None,
+            "error": None,
+            "diagnostics": None,
+        }
+        self._write(job_id, status)
+        return status
+    
+    def _write(self, job_id: str, status: dict) -> None:
+        path = self.path(job_id, "status.json")
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as target:
+            json.dump(status, target, ensure_ascii=False)
+        os.replace(temporary, path)
+    
+    def status(self, job_id: str) -> Optional[dict]:
+        """
+        Liest den Status eines Jobs.
+        
+        Returns:
+            Status-Dictionary oder None, wenn der Job nicht existiert
+        """
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        try:
+            with open(self.path(job_id, "status.json"), encoding="utf-8") as source:
+                status = json.load(source)
+        except (OSError, ValueError):
+            return None
+        
+        if status["status"] not in JOB_FINISHED and not _process_alive(status["pid"], status.get("instance")):
+            # Der ausführende Server-Prozess wurde beendet
+            status = self.update(
+                job_id,
+                status="failed",
+                finished_at=time.time(),
+                error="Job wurde durch einen Neustart des Servers abgebrochen",
+            ) or status
+        return status
+    
+    def update(self, job_id: str, **changes) -> Optional[dict]:
+        """
+        Ändert Felder im Status eines Jobs.
+        
+        Returns:
+            Neuer Status oder None, wenn der Job inzwischen gelöscht wurde
+        """
+        try:
+            with open(self.path(job_id, "status.json"), encoding="utf-8") as source:
+                status = json.load(source)
+            status.update(changes)
+            self._write(job_id, status)
+        except (OSError, ValueError):
+            return None
+        return status
+    
+    def exists(self, job_id: str) -> bool:
+        return os.path.exists(self.path(job_id, "status.json"))
+    
+    def save_results(self, job_id: str, result: pd.DataFrame) -> None:
+        path = self.path(job_id, "results.pkl")
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        result.to_pickle(temporary)
+        os.replace(temporary, path)
+    
+    def load_results(self, job_id: str) -> pd.DataFrame:
+        """Lädt die Rangliste eines abgeschlossenen Jobs (mit Speicher-Cache)."""
+        result = self.results.get(job_id)
+        if result is None:
+            result = pd.read_pickle(self.path(job_id, "results.pkl"))
+            self.results.put(job_id, result)
+        return result
+    
+    def remove_upload(self, job_id: str, upload: str) -> None:
+        try:
+            os.unlink(self.path(job_id, upload))
+        except OSError:
+            pass
+    
+    def delete(self, job_id: str) -> None:
+        shutil.rmtree(self.path(job_id), ignore_errors=True)
+    
+    def prune(self) -> None:
+        """Löscht Jobs, die länger als retention_seconds abgeschlossen sind."""
+        if not os.path.isdir(self.directory):
+            return
+        expired = time.time() - self.retention_seconds
+        for entry in os.scandir(self.directory):
+            status = self.status(entry.name)
+            if status is not None and status["status"] in JOB_FINISHED and status["finished_at"] < expired:
+                self.delete(entry.name)
+
+
+class ScoringJobs:
+    """
+    Führt Scoring-Jobs im Hintergrund aus.
+    
+    Ein eigener Thread-Pool (max_workers) verhindert, dass lange Jobs die
+    Threads der Request-Handler belegen. Höchstens max_workers + max_queued
+    Jobs sind gleichzeitig angenommen, weitere werden mit 503 abgewiesen.
+    Der Fortschritt wird nach jedem bewerteten Block in den JobStore
+    geschrieben; ein gelöschter Job bricht vor dem nächsten Block ab.
+    """
+    
+    def __init__(self, store: JobStore, max_workers: int, max_queued: int):
+        self.store = store
+        self.max_workers = max(1, max_workers)
+        self.max_queued = max(0, max_queued)
+        self.pending = 0
+        self.rejected = 0
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="scoring-job")
+            return self._executor
+    
+    def submit(self, source, filename: str, options: dict) -> dict:
+        """
+        Legt einen Job an und reiht ihn ein (blockierend, kopiert den Upload).
+        
+        Raises:
+            HTTPException: 503 wenn bereits zu viele Jobs angenommen sind
+        """
+        with self.lock:
+            if self.pending >= self.max_workers + self.max_queued:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Zu viele laufende Jobs, bitte später erneut versuchen",
+                    headers={"Retry-After": str(SCORING_RETRY_AFTER_SECONDS)},
+                )
+            self.pending += 1
+        
+        try:
+            status = self.store.create(source, filename, options)
+            self.executor.submit(self._run, status)
+        except BaseException:
+            self._finished()
+            raise
+        return status
+    
+    def _finished(self) -> None:
+        with self.lock:
+            self.pending -= 1
+    
+    def _run(self, status: dict) -> None:
+        job_id = status["job_id"]
+        progress = dict(status["progress"])
+        
+        def count(rows_parsed: int, rows_scored: int) -> None:
+            progress["rows_parsed"] += rows_parsed
+            progress["rows_scored"] += rows_scored
+            progress["rows_skipped"] += rows_parsed - rows_scored
+        
+        try:
+            if self.store.update(job_id, status="running", started_at=time.time()) is None:
+                return
+            
+            options = status["options"]
+            ranking = ScoreRanking(top_k=options["top_k"], per_product=options["per_product"])
+            diagnostics = ScoringDiagnostics()
+            with open(self.store.path(job_id, status["upload"]), "rb") as source:
+                for result in iter_upload_results(source, status["filename"], count):
+                    diagnostics.merge_frame(result)
+                    ranking.add(result)
+                    if self.stopping.is_set():
+                        raise HTTPException(
+                            status_code=503, detail="Job wurde durch Herunterfahren des Servers abgebrochen"
+                        )
+                    if self.store.update(job_id, progress=progress) is None:
+                        # Job wurde gelöscht
+                        return
+            
+            if not len(ranking):
+                raise HTTPException(
+                    status_code=400,
+                    detail="Keine gültigen Daten gefunden. Bitte überprüfen Sie das Dateiformat."
+                )
+            
+            result = ranking.to_frame()
+            self.store.save_results(job_id, result)
+            self.store.update(
+                job_id, status="done", finished_at=time.time(), progress=progress, result_count=len(result),
+                diagnostics=diagnostics.to_dict(),
+            )
+            
+        except Exception as e:
+            if isinstance(e, pd.errors.EmptyDataError):
+                error = "Die Datei ist leer"
+            elif isinstance(e, HTTPException):
+                error = e.detail
+            else:
+                error = f"Fehler: {str(e)}"
+            self.store.update(job_id, status="failed", finished_at=time.time(), progress=progress, error=error)
+        finally:
+            self.store.remove_upload(job_id, status["upload"])
+            self._finished()
+    
+    def shutdown(self) -> None:
+        self.stopping.set()
+        with self.lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+scoring_jobs = ScoringJobs(
+    JobStore(SCORING_JOBS_DIR, JOB_RETENTION_SECONDS, JOB_RESULT_CACHE_BYTES),
+    SCORING_JOB_WORKERS,
+    SCORING_JOB_QUEUE_LIMIT,
+)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    file: UploadFile = File(...),
+    top_k: Optional[int] = Query(None, ge=1, description="Nur die besten k Standorte speichern"),
+    per_product: bool = Query(False, description="top_k je Produkt statt insgesamt anwenden"),
+):
+    """
+    Nimmt einen Upload als Hintergrund-Job an (für sehr große Dateien).
+    
+    Die Datei wird im Job-Verzeichnis abgelegt und von einem Job-Worker
+    bewertet. Fortschritt und Ergebnisse werden über /jobs/{job_id}
+    abgefragt.
+    
+    Args:
+        file: CSV-, Excel-, Parquet- oder Arrow-IPC-Datei
+        top_k: Optional, nur die besten k Standorte speichern
+        per_product: top_k für jedes Produkt einzeln anwenden
+        
+    Returns:
+        job_id, Status und URLs für Status und Ergebnisse
+    """
+    filename = file.filename.lower()
+    check_upload_filename(filename)
+    
+    options = {"top_k": top_k, "per_product": per_product}
+    # Kopieren und Hashen des Uploads belegt einen Platz wie ein Upload an /score/csv
+    release = blocking_work.admit()
+    try:
+        status = await blocking_work.run(scoring_jobs.submit, file.file, filename, options)
+    finally:
+        release()
+    return JSONResponse(status_code=202, content=job_view(status))
+
+
+def job_view(status: dict) -> dict:
+    """Öffentliche Sicht auf den Status eines Jobs."""
+    job_id = status["job_id"]
+    view = {
+        "job_id": job_id,
+        "status": status["status"],
+        "filename": status["filename"],
+        "created_at": status["created_at"],
+        "started_at": status["started_at"],
+        "finished_at": status["finished_at"],
+        "progress": status["progress"],
+        "result_count": status["result_count"],
+        "error": status["error"],
+        "diagnostics": status.get("diagnostics"),
+        "status_url": f"/jobs/{job_id}",
+    }
+    if status["status"] == "done":
+        view["results_url"] = f"/jobs/{job_id}/results"
+    return view
+
+
+def get_job_status(job_id: str) -> dict:
+    """
+    Raises:
+        HTTPException: 404 wenn der Job nicht existiert
+    """
+    status = scoring_jobs.store.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' nicht gefunden")
+    return status
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Liefert Status und Fortschritt eines Jobs.
+    
+    Returns:
+        Status (queued, running, done, failed) und Fortschritt mit
+        rows_parsed, rows_scored und rows_skipped
+    """
+    return job_view(get_job_status(job_id))
+
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0, description="Erster Rang (0 = bester Standort)"),
+    limit: Optional[int] = Query(None, ge=1, le=JOB_MAX_PAGE_SIZE, description="Standorte pro Seite"),
+    output_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
+    """
+    Liefert die Rangliste eines abgeschlossenen Jobs (höchster Score zuerst).
+    
+    Args:
+        job_id: ID aus POST /jobs
+        offset: Erster Rang der Seite
+        limit: Standorte pro Seite (json: Standard JOB_PAGE_SIZE, ndjson:
+            ohne Angabe alle ab offset)
+        output_format: "json" (Seite mit total und next_offset) oder
+            "ndjson" (gestreamt)
+    """
+    status = get_job_status(job_id)
+    if status["status"] != "done":
+        raise HTTPException(
+            status_code=409,
+            detail=status["error"] or f"Job ist noch nicht abgeschlossen (Status: {status['status']})"
+        )
+    
+    # Laden und Umwandeln der Ergebnisse belegt einen Platz; beim Streamen
+    # bis zur letzten Zeile
+    release = blocking_work.admit()
+    streaming = False
+    
+    try:
+        result = await blocking_work.run(scoring_jobs.store.load_results, job_id)
+        total = len(result)
+        if limit is None and output_format == "json":
+            limit = JOB_PAGE_SIZE
+        page = result.iloc[offset:] if limit is None else result.iloc[offset:offset + limit]
+        next_offset = offset + len(page) if offset + len(page) < total else None
+        
+        if output_format == "ndjson":
+            blocks = [page.iloc[start:start + CSV_CHUNK_ROWS] for start in range(0, len(page), CSV_CHUNK_ROWS)]
+            blocks = blocks or [page]
+            streaming = True
+            return StreamingResponse(
+                release_after(aiter_ndjson(blocks[0], _aiter_frames(blocks[1:])), release),
+                media_type="application/x-ndjson",
+                headers={"X-Total-Count": str(total)},
+            )
+        
+        return {
+            "job_id": job_id,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "next_offset": next_offset,
+            "results": await blocking_work.run(dataframe_to_records, page),
+        }
+    finally:
+        if not streaming:
+            release()
+
+
+@app.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    """
+    Bricht einen Job ab bzw. löscht ihn samt Ergebnissen.
+    
+    Ein laufender Job stoppt vor dem nächsten Block.
+    """
+    get_job_status(job_id)
+    await blocking_work.run(scoring_jobs.store.delete, job_id)
+    return {"job_id": job_id, "status": "deleted"}
+
+
+# Ablage für gespeicherte Portfolios (Snapshot + Änderungsjournal)
+SCORING_PORTFOLIOS_DIR = os.environ.get("SCORING_PORTFOLIOS_DIR") or os.path.join(
+    tempfile.gettempdir(), "scoring_portfolios"
+)
+
+# Ab so vielen Journal-Zeilen wird ein neuer Snapshot geschrieben
+PORTFOLIO_COMPACT_ROWS = 50_000
+
+# Ab diesem Anteil geänderter Standorte wird die Rangliste neu sortiert statt einzeln aktualisiert
+PORTFOLIO_RESORT_FRACTION = 0.125
+
+PORTFOLIO_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# Ranglisten-Schlüssel: (Score-Offset - Score in Zehnteln) << Bits | Sequenz
+RANK_SCORE_OFFSET = 1 << 20
+RANK_SEQUENCE_BITS = 40
+
+
+def _rank_keys(scores: np.ndarray, sequences: np.ndarray) -> np.ndarray:
+    """
+    Sortierschlüssel als int64: aufsteigend sortiert ergibt sich höchster
+    Score zuerst, bei Gleichstand die Reihenfolge des Einfügens.
+    """
+    tenths = np.rint(np.asarray(scores, dtype=np.float64) * 10).astype(np.int64)
+    return ((RANK_SCORE_OFFSET - tenths) << RANK_SEQUENCE_BITS) | np.asarray(sequences, dtype=np.int64)
+
+
+class Portfolio:
+    """
+    Gespeichertes Portfolio mit laufend gepflegter Rangliste.
+    
+    Standorte sind über (product, location_id) adressiert und bekommen
+    beim ersten Einfügen eine Sequenznummer; alle Spalten liegen als Arrays
+    mit der Sequenz als Index. Die Rangliste ist eine sortierte Liste von
+    int-Schlüsseln (siehe _rank_keys). Bei wenigen Änderungen werden nur die
+    betroffenen Schlüssel per bisect entfernt und eingefügt, bei vielen wird
+    neu sortiert.
+    """
+    
+    def __init__(self, name: str, generation: str, fingerprint: str):
+        self.name = name
+        self.generation = generation
+        self.fingerprint = fingerprint
+        self.factor_names = list(_scoring_config.factor_names)
+        self.location_ids = np.zeros(0, dtype=np.int64)
+        self.products = np.zeros(0, dtype=object)
+        self.names = np.zeros(0, dtype=object)
+        self.scores = np.zeros(0, dtype=np.float64)
+        self.values = np.zeros((0, len(self.factor_names)), dtype=np.float64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.index: Dict[Tuple[str, int], int] = {}
+        self.ranking: List[int] = []
+        self.next_sequence = 0
+        # Zähler für Änderungen und normalisierte Faktormatrizen je Produkt
+        self.version = 0
+        self._normalized: Dict[str, Tuple[int, np.ndarray, np.ndarray]] = {}
+        # Position im Journal der aktuellen Generation und Zeilen seit dem Snapshot
+        self.journal_offset = 0
+        self.journal_rows = 0
+    
+    def __len__(self) -> int:
+        return len(self.index)
+    
+    def _reserve(self, count: int) -> None:
+        needed = self.next_sequence + count
+        if needed <= len(self.scores):
+            return
+        capacity = max(needed, 2 * len(self.scores), 1024)
+        
+        def grow(array: np.ndarray) -> np.ndarray:
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:len(array)] = array
+            return grown
+        
+        self.location_ids = grow(self.location_ids)
+        self.products = grow(self.products)
+        self.names = grow(self.names)
+        self.scores = grow(self.scores)
+        self.values = grow(self.values)
+        self.alive = grow(self.alive)
+    
+    def add_results(self, result: pd.DataFrame) -> np.ndarray:
+        """
+        Fügt Ergebnisse aus score_dataframe ein bzw. ersetzt vorhandene Standorte.
+        
+        Args:
+            result: DataFrame aus score_dataframe, optional mit fester
+                Sequenznummer je Zeile in _sequence (aus einem Snapshot)
+            
+        Returns:
+            Sequenznummern der geänderten Standorte
+        """
+        result = result.drop_duplicates(["product", "location_id"], keep="last")
+        if result.empty:
+            return np.zeros(0, dtype=np.int64)
+        
+        sequences = result["_sequence"].to_numpy(dtype=np.int64) if "_sequence" in result.columns else None
+        self._reserve(len(result) if sequences is None else int(sequences.max()) + 1 - self.next_sequence)
+        
+        keys = list(zip(result["product"].tolist(), result["location_id"].tolist()))
+        changed = np.empty(len(keys), dtype=np.int64)
+        existing = []
+        for position, key in enumerate(keys):
+            sequence = self.index.get(key)
+            if sequence is not None:
+                existing.append(sequence)
+            elif sequences is not None:
+                sequence = int(sequences[position])
+                self.index[key] = sequence
+            else:
+                sequence = self.next_sequence
+                self.next_sequence += 1
+                self.index[key] = sequence
+            changed[position] = sequence
+        if sequences is not None:
+            self.next_sequence = max(self.next_sequence, int(sequences.max()) + 1)
+        
+        resort = len(changed) > PORTFOLIO_RESORT_FRACTION * max(len(self.ranking), 1)
+        if existing and not resort:
+            existing = np.array(existing, dtype=np.int64)
+            for key in _rank_keys(self.scores[existing], existing).tolist():
+                del self.ranking[bisect.bisect_left(self.ranking, key)]
+        
+        self.location_ids[changed] = result["location_id"].to_numpy()
+        self.products[changed] = result["product"].to_numpy()
+        self.names[changed] = result["location_name"].to_numpy()
+        self.scores[changed] = result["score"].to_numpy()
+        self.values[changed] = result.reindex(columns=self.factor_names).to_numpy(dtype=np.float64)
+        self.alive[changed] = True
+        self.version += 1
+        
+        if resort:
+            self._resort()
+        else:
+            for key in _rank_keys(self.scores[changed], changed).tolist():
+                bisect.insort(self.ranking, key)
+        
+        return changed
+    
+    def remove(self, product: str, location_id: int) -> bool:
+        sequence = self.index.pop((product, location_id), None)
+        if sequence is None:
+            return False
+        self.alive[sequence] = False
+        self.version += 1
+        key = int(_rank_keys(self.scores[sequence:sequence + 1], [sequence])[0])
+        del self.ranking[bisect.bisect_left(self.ranking, key)]
+        return True
+    
+    def _resort(self) -> None:
+        sequences = np.fromiter(self.index.values(), dtype=np.int64, count=len(self.index))
+        self.ranking = np.sort(_rank_keys(self.scores[sequences], sequences)).tolist()
+    
+    def normalized(self, product: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Normalisierte Faktormatrix eines Produkts, zwischengespeichert bis
+        zur nächsten Änderung des Portfolios.
+        
+        Returns:
+            Tuple (sequences, matrix) - Sequenzen der Standorte und eine
+            Zeile pro Faktor des Plans (fehlende Faktoren 0.5)
+        """
+        cached = self._normalized.get(product)
+        if cached is not None and cached[0] == self.version:
+            return cached[1], cached[2]
+        
+        plan = _scoring_config.plans[product]
+        count = self.next_sequence
+        sequences = np.flatnonzero(self.alive[:count] & (self.products[:count] == product))
+        matrix = np.empty((len(plan.factors), len(sequences)))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for row, factor in enumerate(plan.factors):
+                values = self.values[sequences, self.factor_names.index(factor.name)]
+                matrix[row] = np.where(np.isnan(values), 0.5, _normalize_factor_array(values, factor))
+        
+        self._normalized[product] = (self.version, sequences, matrix)
+        return sequences, matrix
+    
+    def rank(self, sequence: int) -> int:
+        """Rang eines Standorts (1 = höchster Score)."""
+        key = int(_rank_keys(self.scores[sequence:sequence + 1], [sequence])[0])
+        return bisect.bisect_left(self.ranking, key) + 1
+    
+    def frame(self, sequences: np.ndarray) -> pd.DataFrame:
+        """Standorte in der gegebenen Reihenfolge im Format von score_dataframe."""
+        frame = pd.DataFrame({
+            "location_id": self.location_ids[sequences],
+            "location_name": self.names[sequences],
+            "product": self.products[sequences],
+            "score": self.scores[sequences],
+        })
+        values = self.values[sequences]
+        for position, factor_name in enumerate(self.factor_names):
+            frame[factor_name] = values[:, position]
+        return frame
+    
+    def ranked_sequences(self, offset: int, limit: int, product: Optional[str] = None) -> Tuple[np.ndarray, int]:
+        """
+        Sequenznummern einer Seite der Rangliste.
+        
+        Returns:
+            Tuple (sequences, total) - total ist die Anzahl Standorte
+            (des Produkts)
+        """
+        mask = (1 << RANK_SEQUENCE_BITS) - 1
+        if product is None:
+            keys = np.array(self.ranking[offset:offset + limit], dtype=np.int64)
+            return keys & mask, len(self.ranking)
+        
+        sequences = np.array(self.ranking, dtype=np.int64) & mask
+        sequences = sequences[self.products[sequences] == product]
+        return sequences[offset:offset + limit], len(sequences)
+    
+    def to_frame(self) -> pd.DataFrame:
+        """Alle Standorte in Einfügereihenfolge, mit Sequenzspalte (für Snapshots)."""
+        sequences = np.sort(np.fromiter(self.index.values(), dtype=np.int64, count=len(self.index)))
+        return self.frame(sequences).assign(_sequence=sequences)
+    
+    def apply(self, changes: dict) -> Tuple[np.ndarray, List[int], int]:
+        """
+        Wendet Änderungen im Format von PortfolioChanges an.
+        
+        Nur die geänderten Standorte werden bewertet, mit denselben Regeln
+        wie bei Uploads.
+        
+        Returns:
+            Tuple (changed, skipped, deleted) - Sequenzen der geänderten
+            Standorte, Positionen übersprungener upsert-Einträge und Anzahl
+            gelöschter Standorte
+        """
+        changed = np.zeros(0, dtype=np.int64)
+        skipped = []
+        
+        upserts = changes.get("upsert") or []
+        if upserts:
+            df = pd.DataFrame([
+                {
+                    **site["factors"],
+                    "location_id": site["location_id"],
+                    "location_name": site["location_name"],
+                    "product": site["product"],
+                }
+                for site in upserts
+            ])
+            result = score_dataframe(df, "Portfolio")
+            scored = set(zip(result["product"].tolist(), result["location_id"].tolist()))
+            skipped = [
+                position for position, site in enumerate(upserts)
+                if (str(site["product"]).lower().strip(), site["location_id"]) not in scored
+            ]
+            changed = self.add_results(result)
+        
+        deleted = 0
+        for site in changes.get("delete") or []:
+            if site.get("product") is None:
+                products = list(_scoring_config.plans)
+            else:
+                products = [str(site["product"]).lower().strip()]
+            for product in products:
+                deleted += self.remove(product, site["location_id"])
+        
+        return changed, skipped, deleted
+
+
+def resolve_weights(overrides: Dict[str, Dict[str, float]]) -> Dict[str, np.ndarray]:
+    """
+    Gewichtsvektoren aller Produkte, mit geänderten Gewichten aus overrides.
+    
+    Nicht angegebene Faktoren behalten ihr Gewicht aus PRODUCT_FACTORS.
+    Geänderte Vektoren werden auf die Summe 1 skaliert, damit Scores
+    zwischen 0 und 100 bleiben.
+    
+    Raises:
+        HTTPException: 400 bei unbekanntem Produkt/Faktor oder ungültigen Gewichten
+    """
+    plans = _scoring_config.plans
+    weights = {product: np.array(plan.weights, dtype=np.float64) for product, plan in plans.items()}
+    
+    for product, factor_weights in overrides.items():
+        plan = plans.get(product)
+        if plan is None:
+            raise HTTPException(status_code=400, detail=f"Unbekanntes Produkt: {product}")
+        for factor_name, weight in factor_weights.items():
+            if factor_name not in plan.factor_names:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Unbekannter Faktor für {product}: {factor_name}"
+                )
+            if not math.isfinite(weight) or weight < 0:
+                raise HTTPException(status_code=400, detail=f"Ungültiges Gewicht für {factor_name}: {weight}")
+            weights[product][plan.factor_names.index(factor_name)] = weight
+        
+        total = weights[product].sum()
+        if total <= 0:
+            raise HTTPException(status_code=400, detail=f"Gewichte für {product} ergeben zusammen 0")
+        if abs(total - 1.0) > 1e-9:
+            weights[product] /= total
+    
+    return weights
+
+
+def weighted_scores(matrix: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Scores (0-100, gerundet) aus normalisierter Faktormatrix und Gewichten.
+    
+    Matrix-Vektor-Produkt, Faktor für Faktor in derselben Reihenfolge
+    summiert wie calculate_product_score, damit Standardgewichte exakt
+    dieselben Scores ergeben.
+    """
+    score = np.zeros(matrix.shape[1])
+    for weight, normalized in zip(weights, matrix):
+        score += weight * normalized
+    return _round_scores(score)
+
+
+# Scores x Standorte pro Block im Sweep (klein genug für den CPU-Cache)
+SENSITIVITY_BLOCK_CELLS = 400_000
+
+# Höchstens so viele Ränge werden für den Median gehalten; darüber wird er
+# aus gleichmäßig verteilten Stichproben des Sweeps bestimmt
+SENSITIVITY_MEDIAN_CELLS = 16_000_000
+
+# Mögliche Scores in Zehnteln (0.0 bis 100.0)
+SCORE_TENTHS = 1001
+
+
+def sample_weight_vectors(base: np.ndarray, method: str, samples: int, spread: float, seed: int) -> np.ndarray:
+    """
+    Gewichtsvektoren um base, jeder auf die Summe 1 skaliert.
+    
+    Args:
+        base: Gewichte im Mittelpunkt
+        method: "random" (jedes Gewicht unabhängig gleichverteilt in
+            base * [1 - spread, 1 + spread]) oder "grid" (alle Kombinationen
+            gleichmäßiger Stufen in diesem Bereich)
+        samples: Höchstzahl Vektoren
+        spread: Relative Abweichung je Gewicht
+        seed: Startwert des Zufallsgenerators
+        
+    Returns:
+        Array mit einem Gewichtsvektor pro Zeile
+    """
+    if method == "grid":
+        levels = max(2, int(samples ** (1 / len(base)) + 1e-9))
+        factors = np.linspace(1 - spread, 1 + spread, levels)
+        grid = np.stack(np.meshgrid(*[factors] * len(base), indexing="ij"), axis=-1).reshape(-1, len(base))
+        if len(grid) > samples:
+            grid = grid[np.linspace(0, len(grid) - 1, samples).astype(np.int64)]
+        vectors = grid * base
+    else:
+        rng = np.random.default_rng(seed)
+        vectors = rng.uniform(1 - spread, 1 + spread, size=(samples, len(base))) * base
+    
+    totals = vectors.sum(axis=1, keepdims=True)
+    return vectors / np.where(totals > 0, totals, 1)
+
+
+def _tenth_ranks(matrix: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Ränge aller Standorte für einen Block von Gewichtsvektoren.
+    
+    Die Scores entstehen per Matrixmultiplikation (float64) und werden wie
+    round() auf Zehntel gerundet (np.rint, bei exakten Gleichständen zur
+    geraden Zahl). Da die Multiplikation in anderer Reihenfolge summiert als
+    calculate_product_score, kann ein Score bei Werten direkt an der Grenze
+    x.x5 um ein Zehntel vom Score der API abweichen. Die Ränge ergeben sich
+    per Zählsortierung über die 1001 möglichen Scores: Rang = 1 + Anzahl
+    Standorte mit höherem Score, gleiche Scores teilen sich den besten Rang.
+    
+    Args:
+        matrix: Normalisierte Faktoren in [0, 1], eine Zeile pro Faktor
+        weights: Ein Gewichtsvektor pro Zeile (Summe 1)
+        
+    Returns:
+        Array (Vektoren x Standorte) mit den Rängen
+    """
+    rows, sites = len(weights), matrix.shape[1]
+    # Werte in [0, 1] und Gewichte mit Summe 1 halten alle Scores in 0..1000 Zehnteln
+    scores = (weights * (SCORE_TENTHS - 1)) @ matrix
+    np.rint(scores, out=scores)
+    np.clip(scores, 0, SCORE_TENTHS - 1, out=scores)
+    # Je Zeile um SCORE_TENTHS versetzt für eine gemeinsame Zählung
+    codes = scores.astype(np.intp)
+    codes += np.arange(rows, dtype=np.intp)[:, None] * SCORE_TENTHS
+    
+    counts = np.bincount(codes.ravel(), minlength=rows * SCORE_TENTHS).reshape(rows, SCORE_TENTHS)
+    # Rang je Score: 1 + Anzahl Standorte mit höherem Score
+    return np.take((sites + 1 - np.cumsum(counts, axis=1)).astype(np.int32).ravel(), codes)
+
+
+def rank_distribution(matrix: np.ndarray, weight_vectors: np.ndarray, top_k: int) -> Dict[str, np.ndarray]:
+    """
+    Rangverteilung jedes Standorts über viele Gewichtsvektoren.
+    
+    Die Vektoren werden blockweise mit _tenth_ranks ausgewertet.
+    
+    Args:
+        matrix: Normalisierte Faktoren, eine Zeile pro Faktor
+        weight_vectors: Ein Gewichtsvektor pro Zeile (Summe 1)
+        top_k: Grenze für top_k_probability
+        
+    Returns:
+        Dictionary mit min_rank, median_rank, max_rank und
+        top_k_probability je Standort
+    """
+    sites = matrix.shape[1]
+    samples = len(weight_vectors)
+    matrix = np.clip(matrix, 0, 1)
+    
+    min_rank = np.full(sites, sites, dtype=np.int32)
+    max_rank = np.zeros(sites, dtype=np.int32)
+    in_top_k = np.zeros(sites, dtype=np.int64)
+    
+    median_count = min(samples, max(1, SENSITIVITY_MEDIAN_CELLS // max(sites, 1)))
+    median_samples = np.unique(np.linspace(0, samples - 1, median_count).astype(np.int64))
+    median_ranks = np.empty((len(median_samples), sites), dtype=np.uint32)
+    
+    block = max(1, SENSITIVITY_BLOCK_CELLS // max(sites, 1))
+    for start in range(0, samples, block):
+        ranks = _tenth_ranks(matrix, weight_vectors[start:start + block])
+        rows = len(ranks)
+        
+        np.minimum(min_rank, ranks.min(axis=0), out=min_rank)
+        np.maximum(max_rank, ranks.max(axis=0), out=max_rank)
+        in_top_k += (ranks <= top_k).sum(axis=0)
+        
+        selected = (median_samples >= start) & (median_samples < start + rows)
+        median_ranks[selected] = ranks[median_samples[selected] - start]
+    
+    return {
+        "min_rank": min_rank,
+        "median_rank": np.median(median_ranks, axis=0),
+        "max_rank": max_rank,
+        "top_k_probability": in_top_k / samples,
+    }
+
+
+def sensitivity_results(frame: pd.DataFrame, matrix: np.ndarray, weights: np.ndarray,
+                        request: SensitivityRequest) -> Tuple[List[dict], int, int]:
+    """
+    Sweep über Gewichtsvektoren um weights für alle Standorte eines Produkts.
+    
+    Args:
+        frame: Standorte (location_id, location_name, score) in Reihenfolge der Matrix
+        matrix: Normalisierte Faktoren, eine Zeile pro Faktor
+        weights: Gewichte im Mittelpunkt
+        request: Parameter des Sweeps
+        
+    Returns:
+        Tuple (results, total, samples) - Seite der Standorte nach
+        baseline_rank, Anzahl Standorte und Anzahl ausgewerteter Vektoren
+    """
+    vectors = sample_weight_vectors(weights, request.method, request.samples, request.spread, request.seed)
+    if frame.empty:
+        return [], 0, len(vectors)
+    
+    # Wie die Ränge des Sweeps berechnet, damit der Mittelpunkt in [min_rank, max_rank] liegt
+    centre = weights / weights.sum() if weights.sum() > 0 else weights
+    baseline_rank = _tenth_ranks(np.clip(matrix, 0, 1), centre[None, :])[0]
+    result = pd.DataFrame({
+        "location_id": frame["location_id"].to_numpy(),
+        "location_name": frame["location_name"].to_numpy(),
+        "score": weighted_scores(matrix, weights),
+        "baseline_rank": baseline_rank,
+        **rank_distribution(matrix, vectors, request.top_k),
+    })
+    # Seite nach baseline_rank (nicht nach score, der an Rundungsgrenzen um
+    # ein Zehntel abweichen kann), bei gleichem Rang in Matrix-Reihenfolge
+    positions = _top_k_positions(-baseline_rank, np.arange(len(result)), request.offset + request.limit)
+    page = result.take(positions[request.offset:])
+    return page.to_dict("records"), len(result), len(vectors)
+
+
+def rescore_portfolio(portfolio: Portfolio) -> Portfolio:
+    """
+    Bewertet alle Standorte mit den gespeicherten Faktorwerten neu (nach
+    einer Änderung von PRODUCT_FACTORS). Sequenznummern bleiben erhalten.
+    """
+    frame = portfolio.to_frame()
+    rescored = Portfolio(portfolio.name, portfolio.generation, _scoring_config.fingerprint)
+    if frame.empty:
+        return rescored
+    
+    scored = score_dataframe(frame.drop(columns=["score", "_sequence"]), "Portfolio")
+    sequences = frame[["product", "location_id", "_sequence"]]
+    rescored.add_results(scored.merge(sequences, on=["product", "location_id"], how="left"))
+    return rescored
+
+
+class PortfolioStore:
+    """
+    Gespeicherte Portfolios auf der Festplatte, geladen im Speicher.
+    
+    Pro Portfolio gibt es ein Verzeichnis mit CURRENT (aktuelle
+    Generation), snapshot-<generation>.pkl und journal-<generation>.jsonl.
+    Änderungen werden als JSON-Zeile an das Journal angehängt; ab
+    compact_rows Journal-Zeilen wird ein neuer Snapshot geschrieben. Jeder
+    Zugriff sperrt das Portfolio (auch über Prozesse hinweg) und spielt
+    vorher Journal-Einträge anderer Prozesse nach.
+    """
+    
+    def __init__(self, directory: str, compact_rows: int):
+        self.directory = directory
+        self.compact_rows = compact_rows
+        self.loaded: Dict[str, Portfolio] = {}
+        self.locks: Dict[str, threading.Lock] = {}
+        self.lock = threading.Lock()
+    
+    def path(self, name: str, filename: str = "") -> str:
+        return os.path.join(self.directory, name, filename)
+    
+    def _check_name(self, name: str) -> None:
+        if not PORTFOLIO_NAME_PATTERN.fullmatch(name):
+            raise HTTPException(
+                status_code=400,
+                detail="Ungültiger Portfolio-Name (erlaubt: Buchstaben, Ziffern, '-' und '_', höchstens 64 Zeichen)"
+            )
+    
+    @contextlib.contextmanager
+    def _locked(self, name: str, create: bool = False):
+        """Sperrt ein Portfolio für andere Threads und Prozesse (andere Portfolios bleiben frei)."""
+        self._check_name(name)
+        with self.lock:
+            portfolio_lock = self.locks.setdefault(name, threading.Lock())
+        with portfolio_lock:
+            if create:
+                os.makedirs(self.path(name), exist_ok=True)
+            elif not os.path.isdir(self.path(name)):
+                self.loaded.pop(name, None)
+                raise HTTPException(status_code=404, detail=f"Portfolio '{name}' nicht gefunden")
+            with open(self.path(name, "lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+    
+    def _current_generation(self, name: str) -> Optional[str]:
+        try:
+            with open(self.path(name, "CURRENT"), encoding="utf-8") as source:
+                return source.read().strip() or None
+        except OSError:
+            return None
+    
+    def _sync(self, name: str) -> Portfolio:
+        """Lädt das Portfolio bzw. spielt neue Journal-Einträge nach (unter Sperre)."""
+        generation = self._current_generation(name)
+        if generation is None:
+            self.loaded.pop(name, None)
+            raise HTTPException(status_code=404, detail=f"Portfolio '{name}' nicht gefunden")
+        
+        portfolio = self.loaded.get(name)
+        if portfolio is None or portfolio.generation != generation:
+            frame = pd.read_pickle(self.path(name, f"snapshot-{generation}.pkl"))
+            portfolio = Portfolio(name, generation, frame.attrs.get("fingerprint"))
+            portfolio.add_results(frame)
+            self.loaded[name] = portfolio
+        
+        try:
+            with open(self.path(name, f"journal-{generation}.jsonl"), "rb") as journal:
+                journal.seek(portfolio.journal_offset)
+                for line in journal:
+                    if not line.endswith(b"\n"):
+                        break
+                    changes = json.loads(line)
+                    portfolio.apply(changes)
+                    portfolio.journal_offset += len(line)
+                    portfolio.journal_rows += len(changes["upsert"]) + len(changes["delete"])
+        except FileNotFoundError:
+            pass
+        
+        if portfolio.fingerprint != _scoring_config.fingerprint:
+            # PRODUCT_FACTORS geändert: neu bewerten und als Snapshot sichern
+            portfolio = rescore_portfolio(portfolio)
+            portfolio.generation = self._write_snapshot(name, portfolio.to_frame(), portfolio.fingerprint)
+            self.loaded[name] = portfolio
+        
+        return portfolio
+    
+    def _write_snapshot(self, name: str, frame: pd.DataFrame, fingerprint: str) -> str:
+        """Schreibt einen Snapshot als neue Generation und löscht die alte."""
+        previous = self._current_generation(name)
+        generation = uuid.uuid4().hex
+        frame.attrs["fingerprint"] = fingerprint
+        frame.to_pickle(self.path(name, f"snapshot-{generation}.pkl"))
+        
+        temporary = self.path(name, f"CURRENT.{threading.get_ident()}.tmp")
+        with open(temporary, "w", encoding="utf-8") as target:
+            target.write(generation)
+        os.replace(temporary, self.path(name, "CURRENT"))
+        
+        if previous is not None:
+            for filename in (f"snapshot-{previous}.pkl", f"journal-{previous}.jsonl"):
+                try:
+                    os.unlink(self.path(name, filename))
+                except OSError:
+                    pass
+        return generation
+    
+    def replace(self, name: str, results: List[pd.DataFrame]) -> Portfolio:
+        """Legt ein Portfolio aus bewerteten Upload-Blöcken neu an (ersetzt ein vorhandenes)."""
+        with self._locked(name, create=True):
+            frame = pd.concat(results, ignore_index=True).drop_duplicates(["product", "location_id"], keep="last")
+            frame = frame.assign(_sequence=np.arange(len(frame), dtype=np.int64))
+            self._write_snapshot(name, frame, _scoring_config.fingerprint)
+            self.loaded.pop(name, None)
+            return self._sync(name)
+    
+    def change(self, name: str, changes: dict) -> dict:
+        """
+        Wendet Änderungen an und hängt sie an das Journal an.
+        
+        Returns:
+            Zusammenfassung mit neuen Scores und Rängen der geänderten Standorte
+        """
+        with self._locked(name):
+            portfolio = self._sync(name)
+            changed, skipped, deleted = portfolio.apply(changes)
+            
+            with open(self.path(name, f"journal-{portfolio.generation}.jsonl"), "ab") as journal:
+                journal.write((json.dumps(changes, ensure_ascii=False) + "\n").encode())
+                portfolio.journal_offset = journal.tell()
+            portfolio.journal_rows += len(changes["upsert"]) + len(changes["delete"])
+            
+            if portfolio.journal_rows >= self.compact_rows:
+                portfolio.generation = self._write_snapshot(name, portfolio.to_frame(), portfolio.fingerprint)
+                portfolio.journal_offset = 0
+                portfolio.journal_rows = 0
+            
+            upserts = changes["upsert"]
+            return {
+                "name": name,
+                "sites": len(portfolio),
+                "upserted": len(upserts) - len(skipped),
+                "deleted": deleted,
+                "skipped": [
+                    {"index": position, "location_id": upserts[position]["location_id"]}
+                    for position in skipped
+                ],
+                "changes": [
+                    {
+                        "location_id": int(portfolio.location_ids[sequence]),
+                        "product": portfolio.products[sequence],
+                        "score": float(portfolio.scores[sequence]),
+                        "rank": portfolio.rank(sequence),
+                    }
+                    for sequence in changed.tolist()
+                    if (portfolio.products[sequence], int(portfolio.location_ids[sequence])) in portfolio.index
+                ],
+            }
+    
+    def page(self, name: str, offset: int, limit: int, product: Optional[str]) -> Tuple[pd.DataFrame, int]:
+        """Seite der Rangliste als Ergebnis-DataFrame und Gesamtzahl."""
+        with self._locked(name):
+            portfolio = self._sync(name)
+            sequences, total = portfolio.ranked_sequences(offset, limit, product)
+            return portfolio.frame(sequences), total
+    
+    def what_if(self, name: str, weights: Dict[str, np.ndarray], offset: int, limit: int,
+                product: Optional[str]) -> Tuple[pd.DataFrame, int]:
+        """
+        Rangliste mit anderen Gewichten, ohne das Portfolio zu ändern.
+        
+        Die normalisierten Faktoren werden je Produkt einmal berechnet und
+        gehalten; jede Anfrage ist danach nur ein Matrix-Vektor-Produkt pro
+        Produkt und eine Teilsortierung.
+        
+        Returns:
+            Tuple (page, total) - Seite als Ergebnis-DataFrame mit
+            baseline_score und baseline_rank sowie Anzahl Standorte
+        """
+        with self._locked(name):
+            portfolio = self._sync(name)
+            products = [product] if product is not None else list(_scoring_config.plans)
+            
+            sequence_parts, score_parts = [], []
+            for product_name in products:
+                if product_name not in _scoring_config.plans:
+                    continue
+                sequences, matrix = portfolio.normalized(product_name)
+                sequence_parts.append(sequences)
+                score_parts.append(weighted_scores(matrix, weights[product_name]))
+            
+            sequences = np.concatenate(sequence_parts) if sequence_parts else np.zeros(0, dtype=np.int64)
+            scores = np.concatenate(score_parts) if score_parts else np.zeros(0)
+            positions = _top_k_positions(scores, sequences, offset + limit)[offset:]
+            
+            page = portfolio.frame(sequences[positions])
+            page["baseline_score"] = page["score"]
+            page["score"] = scores[positions]
+            page["baseline_rank"] = [portfolio.rank(sequence) for sequence in sequences[positions].tolist()]
+            return page, len(sequences)
+    
+    def product_matrix(self, name: str, product: str) -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        Standorte eines Produkts und ihre normalisierte Faktormatrix.
+        
+        Die Arrays werden bei Änderungen ersetzt, nicht verändert, und
+        können daher außerhalb der Sperre ausgewertet werden.
+        """
+        with self._locked(name):
+            portfolio = self._sync(name)
+            sequences, matrix = portfolio.normalized(product)
+            return portfolio.frame(sequences)[["location_id", "location_name", "score"]], matrix
+    
+    def delete(self, name: str) -> None:
+        with self._locked(name):
+            self.loaded.pop(name, None)
+            for entry in os.scandir(self.path(name)):
+                if entry.name != "lock":
+                    os.unlink(entry.path)
+        shutil.rmtree(self.path(name), ignore_errors=True)
+
+
+portfolio_store = PortfolioStore(SCORING_PORTFOLIOS_DIR, PORTFOLIO_COMPACT_ROWS)
+
+
+@app.put("/portfolios/{name}")
+async def create_portfolio(name: str, file: UploadFile = File(...)):
+    """
+    Legt ein Portfolio aus einer hochgeladenen Datei an (ersetzt ein vorhandenes).
+    
+    Die Datei wird wie bei /score/csv bewertet; Standorte sind danach über
+    (product, location_id) adressierbar und können einzeln geändert werden.
+    
+    Args:
+        name: Name des Portfolios
+        file: CSV-, Excel-, Parquet- oder Arrow-IPC-Datei
+    """
+    release = blocking_work.admit()
+    
+    try:
+        portfolio_store._check_name(name)
+        filename = file.filename.lower()
+        check_upload_filename(filename)
+        
+        results = [result async for result in aiter_upload_results(file.file, filename) if not result.empty]
+        if not results:
+            raise HTTPException(
+                status_code=400,
+                detail="Keine gültigen Daten gefunden. Bitte überprüfen Sie das Dateiformat."
+            )
+        
+        portfolio = await blocking_work.run(portfolio_store.replace, name, results)
+        return {"name": name, "sites": len(portfolio)}
+        
+    except pd.errors.EmptyDataError:
+        raise HTTPException(status_code=400, detail="Die Datei ist leer")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Fehler: {str(e)}")
+    finally:
+        release()
+
+
+@app.get("/portfolios/{name}")
+async def get_portfolio(
+    name: str,
+    offset: int = Query(0, ge=0, description="Erster Rang (0 = bester Standort)"),
+    limit: int = Query(JOB_PAGE_SIZE, ge=1, le=JOB_MAX_PAGE_SIZE, description="Standorte pro Seite"),
+    product: Optional[str] = Query(None, description="Nur Standorte dieses Produkts"),
+):
+    """
+    Liefert eine Seite der aktuellen Rangliste eines Portfolios.
+    
+    Returns:
+        Standorte mit Rang (1 = höchster Score), total und next_offset
+    """
+    if product is not None:
+        product = product.lower().strip()
+    
+    release = blocking_work.admit()
+    try:
+        page, total = await blocking_work.run(portfolio_store.page, name, offset, limit, product)
+        records = await blocking_work.run(dataframe_to_records, page)
+    finally:
+        release()
+    for position, record in enumerate(records):
+        record["rank"] = offset + position + 1
+    
+    return {
+        "name": name,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": offset + len(records) if offset + len(records) < total else None,
+        "results": records,
+    }
+
+
+@app.patch("/portfolios/{name}")
+async def change_portfolio(name: str, changes: PortfolioChanges):
+    """
+    Fügt Standorte ein, ändert oder löscht sie.
+    
+    Nur die geänderten Standorte werden bewertet; die Rangliste wird an
+    Ort und Stelle aktualisiert statt neu sortiert.
+    
+    Returns:
+        Neue Scores und Ränge der geänderten Standorte, übersprungene
+        Einträge (ungültiges Produkt oder weniger als MIN_FACTORS_PER_ROW
+        Faktoren) und Anzahl gelöschter Standorte
+    """
+    # Bewerten, Journal schreiben und ggf. verdichten belegt einen Platz wie ein Upload
+    release = blocking_work.admit()
+    try:
+        return await blocking_work.run(portfolio_store.change, name, changes.model_dump())
+    finally:
+        release()
+
+
+@app.post("/portfolios/{name}/what-if")
+async def what_if_portfolio(name: str, request: WhatIfRequest):
+    """
+    Rangliste eines Portfolios mit geänderten Gewichten (ohne zu speichern).
+    
+    Die Faktoren werden nicht neu normalisiert; jede Anfrage berechnet nur
+    die gewichtete Summe der gehaltenen normalisierten Faktormatrix.
+    
+    Returns:
+        Seite der neuen Rangliste; jeder Standort mit rank, score sowie
+        baseline_rank und baseline_score der gespeicherten Rangliste
+    """
+    weights = resolve_weights(request.weights)
+    product = request.product.lower().strip() if request.product is not None else None
+    
+    # Gewichtete Summe über das ganze Portfolio: belegt einen Platz wie der Sweep
+    release = blocking_work.admit()
+    try:
+        page, total = await blocking_work.run(
+            portfolio_store.what_if, name, weights, request.offset, request.limit, product
+        )
+        records = await blocking_work.run(dataframe_to_records, page)
+    finally:
+        release()
+    for position, (record, baseline_score, baseline_rank) in enumerate(
+        zip(records, page["baseline_score"].tolist(), page["baseline_rank"].tolist())
+    ):
+        record["rank"] = request.offset + position + 1
+        record["baseline_score"] = baseline_score
+        record["baseline_rank"] = baseline_rank
+    
+    return {
+        "name": name,
+        "weights": {
+            product_name: dict(zip(_scoring_config.plans[product_name].factor_names, vector.tolist()))
+            for product_name, vector in weights.items()
+        },
+        "total": total,
+        "offset": request.offset,
+        "limit": request.limit,
+        "next_offset": request.offset + len(records) if request.offset + len(records) < total else None,
+        "results": records,
+    }
+
+
+@app.post("/portfolios/{name}/sensitivity")
+async def portfolio_sensitivity(name: str, request: SensitivityRequest):
+    """
+    Rang-Stabilität der Standorte eines Produkts bei unsicheren Gewichten.
+    
+    Bewertet das Portfolio mit bis zu 10.000 Gewichtsvektoren um die
+    Standardgewichte (bzw. request.weights), zufällig oder als Gitter, und
+    liefert je Standort die Verteilung seines Rangs innerhalb des Produkts.
+    
+    Returns:
+        Seite der Standorte (sortiert nach baseline_rank) mit
+        baseline_rank, min_rank, median_rank, max_rank und
+        top_k_probability (Anteil der Vektoren mit Rang <= top_k)
+    """
+    product = request.product.lower().strip()
+    if product not in _scoring_config.plans:
+        raise HTTPException(status_code=400, detail=f"Unbekanntes Produkt: {request.product}")
+    weights = resolve_weights({product: request.weights})[product]
+    
+    # Der Sweep kann Sekunden dauern und belegt einen Platz wie ein Upload
+    release = blocking_work.admit()
+    try:
+        frame, matrix = await blocking_work.run(portfolio_store.product_matrix, name, product)
+        results, total, samples = await blocking_work.run(sensitivity_results, frame, matrix, weights, request)
+    finally:
+        release()
+    
+    return {
+        "name": name,
+        "product": product,
+        "weights": dict(zip(_scoring_config.plans[product].factor_names, weights.tolist())),
+        "method": request.method,
+        "samples": samples,
+        "spread": request.spread,
+        "top_k": request.top_k,
+        "total": total,
+        "offset": request.offset,
+        "limit": request.limit,
+        "next_offset": request.offset + len(results) if request.offset + len(results) < total else None,
+        "results": results,
+    }
+
+
+@app.delete("/portfolios/{name}")
+async def delete_portfolio(name: str):
+    """Löscht ein Portfolio."""
+    release = blocking_work.admit()
+    try:
+        await blocking_work.run(portfolio_store.delete, name)
+    finally:
+        release()
+    return {"name": name, "status": "deleted"}
+
+
+# Medientyp und Dateiendung der Downloads im Arrow-Format
+ARROW_DOWNLOADS = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", "arrow"),
+}
+
+
+def frame_to_arrow_bytes(result: pd.DataFrame, output_format: str) -> bytes:
+    """
+    Schreibt ein Ergebnis-DataFrame als Parquet- oder Arrow-IPC-Datei.
+    
+    Faktorspalten bleiben float64; nicht verwendete Faktoren (NaN) werden
+    zu Nullwerten.
+    """
+    pa = import_pyarrow()
+    table = pa.Table.from_pandas(result, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    
+    if output_format == "parquet":
+        pa.parquet.write_table(table, sink)
+    else:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    
+    return sink.getvalue().to_pybytes()
+
+
+def _ndjson_batches(result: pd.DataFrame) -> Iterator[bytes]:
+    """Kodiert einen Ergebnisblock in Stücken von NDJSON_BATCH_ROWS Zeilen."""
+    for start in range(0, len(result), NDJSON_BATCH_ROWS):
+        records = dataframe_to_records(result.iloc[start:start + NDJSON_BATCH_ROWS])
+        yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode()
+
+
+def _ndjson_error(error: Exception) -> bytes:
+    """Fehlerzeile für Fehler, die erst während des Streamens auftreten."""
+    detail = error.detail if isinstance(error, HTTPException) else f"Fehler: {str(error)}"
+    return (json.dumps({"error": detail}, ensure_ascii=False) + "\n").encode()
+
+
+def iter_ndjson(results) -> Iterator[bytes]:
+    """
+    Kodiert Ergebnisblöcke als NDJSON (ein JSON-Objekt pro Zeile).
+    
+    Die Blöcke werden erst beim Iterieren erzeugt und in Stücken von
+    NDJSON_BATCH_ROWS Zeilen umgewandelt, sodass nie die komplette
+    Ergebnisliste als Dicts oder JSON im Speicher liegt. Tritt während des
+    Streamens ein Fehler auf, wird er als letzte Zeile {"error": ...} gemeldet.
+    
+    Args:
+        results: Iterable mit Ergebnis-DataFrames aus score_dataframe
+        
+    Yields:
+        UTF-8-kodierte NDJSON-Zeilen
+    """
+    try:
+        for result in results:
+            yield from _ndjson_batches(result)
+    except Exception as e:
+        yield _ndjson_error(e)
+
+
+async def aiter_ndjson(first_result: pd.DataFrame, results: AsyncIterator[pd.DataFrame]) -> AsyncIterator[bytes]:
+    """
+    Wie iter_ndjson, für den bereits bewerteten ersten Block und die
+    restlichen Blöcke aus aiter_upload_results.
+    """
+    try:
+        for batch in await blocking_work.run(list, _ndjson_batches(first_result)):
+            yield batch
+        async for result in results:
+            for batch in await blocking_work.run(list, _ndjson_batches(result)):
+                yield batch
+    except Exception as e:
+        yield _ndjson_error(e)
+
+
+def _top_k_positions(scores: np.ndarray, sequence: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positionen der k besten Zeilen, sortiert nach Score (absteigend) und
+    Eingabereihenfolge.
+    
+    Per Teilauswahl (np.partition) werden nur die Kandidaten ab dem k-besten
+    Score sortiert, nicht das ganze Array.
+    """
+    if len(scores) > k:
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((sequence[candidates], -scores[candidates]))
+    return candidates[order[:k]]
+
+
+class ScoreRanking:
+    """
+    Sammelt bewertete Blöcke und bildet daraus die Gesamtrangliste.
+    
+    Jeder Block wird beim Hinzufügen nach Score sortiert; die Rangliste
+    entsteht durch stabiles Mergen der sortierten Blöcke. Gleiche Scores
+    behalten die Reihenfolge der Eingabedatei.
+    
+    Mit top_k werden nur die k besten Standorte gehalten (optional je
+    Produkt), sodass nie die komplette Ergebnismenge gespeichert oder
+    sortiert wird.
+    """
+    
+    def __init__(self, top_k: Optional[int] = None, per_product: bool = False):
+        self.top_k = top_k
+        self.per_product = per_product
+        self.chunks: List[pd.DataFrame] = []
+        # Beste Zeilen je Produkt (bzw. None ohne per_product) im top_k-Modus
+        self.best: Dict[Optional[str], pd.DataFrame] = {}
+        self.rows_seen = 0
+    
+    def __len__(self) -> int:
+        if self.top_k is not None:
+            return sum(len(best) for best in self.best.values())
+        return sum(len(chunk) for chunk in self.chunks)
+    
+    def add(self, result: pd.DataFrame) -> None:
+        """Fügt einen Ergebnisblock aus score_dataframe hinzu."""
+        if result.empty:
+            return
+        
+        with metrics.timer("rank"):
+            self._add(result)
+    
+    def _add(self, result: pd.DataFrame) -> None:
+        # Eingabereihenfolge über alle Blöcke, für stabile Gleichstände
+        result = result.assign(_sequence=np.arange(self.rows_seen, self.rows_seen + len(result)))
+        self.rows_seen += len(result)
+        
+        if self.top_k is None:
+            order = np.argsort(-result["score"].to_numpy(), kind="stable")
+            self.chunks.append(result.take(order).reset_index(drop=True))
+            return
+        
+        if self.per_product:
+            groups = result.groupby("product", sort=False)
+        else:
+            groups = [(None, result)]
+        
+        for key, group in groups:
+            if key in self.best:
+                group = pd.concat([self.best[key], group], ignore_index=True)
+            positions = _top_k_positions(group["score"].to_numpy(), group["_sequence"].to_numpy(), self.top_k)
+            self.best[key] = group.take(positions).reset_index(drop=True)
+    
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Merged alle Blöcke zur Gesamtrangliste (höchster Score zuerst).
+        
+        Die stabile Sortierung (Timsort) nutzt die bereits sortierten Blöcke
+        als Läufe und führt damit einen k-Wege-Merge durch.
+        """
+        parts = list(self.best.values()) if self.top_k is not None else self.chunks
+        if not parts:
+            return pd.DataFrame()
+        
+        if len(parts) == 1:
+            merged = parts[0]
+        elif self.top_k is not None:
+            merged = pd.concat(parts, ignore_index=True)
+            order = np.lexsort((merged["_sequence"].to_numpy(), -merged["score"].to_numpy()))
+            merged = merged.take(order).reset_index(drop=True)
+        else:
+            merged = pd.concat(parts, ignore_index=True)
+            order = np.argsort(-merged["score"].to_numpy(), kind="stable")
+            merged = merged.take(order).reset_index(drop=True)
+        
+        return merged.drop(columns="_sequence")
+    
+    def to_records(self) -> List[dict]:
+        """Gesamtrangliste als JSON-Ergebnisliste."""
+        if not len(self):
+            return []
+        return dataframe_to_records(self.to_frame())
+
+
+# Mindestanzahl gültiger Faktoren, damit eine Zeile bewertet wird
+MIN_FACTORS_PER_ROW = 3
+
+
+def _factor_column_values(column: pd.Series) -> np.ndarray:
+    """
+    Wandelt eine Faktorspalte in ein float64-Array um.
+    
+    Entspricht ``float(wert)`` pro Zelle im zeilenweisen Pfad: fehlende und
+    nicht umwandelbare Zellen werden zu NaN.
+    
+    Args:
+        column: Spalte aus dem hochgeladenen DataFrame
+        
+    Returns:
+        float64-Array mit NaN für fehlende/ungültige Werte
+    """
+    if pd.api.types.is_bool_dtype(column) or pd.api.types.is_numeric_dtype(column):
+        if pd.api.types.is_complex_dtype(column):
+            return np.full(len(column), np.nan)
+        return column.to_numpy(dtype=np.float64, na_value=np.nan)
+    
+    if not (pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column)):
+        # z.B. Datumswerte: float() schlägt fehl, Faktor wird übersprungen
+        return np.full(len(column), np.nan)
+    
+    values = pd.to_numeric(column, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    
+    # Text-Zellen per float(): pandas rundet Dezimalstrings nicht immer exakt
+    # gleich und lehnt manche Schreibweisen ab, die float() akzeptiert (z.B. "1_000")
+    cells = column.to_numpy(dtype=object)
+    retry = np.isnan(values) & column.notna().to_numpy()
+    retry |= np.fromiter((type(cell) is str for cell in cells), dtype=bool, count=len(cells))
+    parsed = {}
+    for position in np.flatnonzero(retry):
+        cell = cells[position]
+        try:
+            value = parsed[cell]
+        except (KeyError, TypeError):
+            try:
+                value = float(cell)
+            except (ValueError, TypeError):
+                value = np.nan
+            if type(cell) is str:
+                parsed[cell] = value
+        values[position] = value
+    
+    return values
+
+
+def _location_id_values(column: pd.Series, rows: np.ndarray):
+    """
+    Wandelt die location_id der ausgewählten Zeilen wie ``int(wert)`` um.
+    
+    Returns:
+        Tuple (ids, valid) - ids als int64-Array, valid als bool-Maske
+    """
+    if pd.api.types.is_integer_dtype(column) and not pd.api.types.is_extension_array_dtype(column):
+        return column.to_numpy()[rows].astype(np.int64), np.ones(len(rows), dtype=bool)
+    
+    if pd.api.types.is_bool_dtype(column) or pd.api.types.is_numeric_dtype(column):
+        if not pd.api.types.is_complex_dtype(column):
+            values = column.to_numpy(dtype=np.float64, na_value=np.nan)[rows]
+            valid = np.isfinite(values) & (np.abs(values) < 2.0 ** 63)
+            return np.trunc(np.where(valid, values, 0)).astype(np.int64), valid
+    
+    raw = column.to_numpy()[rows]
+    ids = np.zeros(len(rows), dtype=np.int64)
+    valid = np.zeros(len(rows), dtype=bool)
+    for position, value in enumerate(raw):
+        try:
+            ids[position] = int(value)
+            valid[position] = True
+        except (ValueError, TypeError, OverflowError):
+            pass
+    
+    return ids, valid
+
+
+def _normalize_factor_array(values: np.ndarray, factor: FactorPlan) -> np.ndarray:
+    """
+    Vektorisierte Variante von normalize_with_plan für ein ganzes Array.
+    
+    Args:
+        values: float64-Array mit Faktorwerten
+        factor: Kompilierter Faktor
+        
+    Returns:
+        Array mit normalisierten Werten zwischen 0 und 1
+    """
+    # Begrenze Werte auf min/max
+    values = np.clip(values, factor.min_val, factor.max_val)
+    curve = factor.curve
+    
+    if curve == CURVE_HIGHER:
+        return (values - factor.min_val) / factor.span
+    
+    elif curve == CURVE_LOWER:
+        return 1.0 - (values - factor.min_val) / factor.span
+    
+    elif curve == CURVE_LOWER_CAPPED:
+        declining = np.maximum(0, 1.0 - (values - factor.pivot) / factor.denominator)
+        return np.where(values <= factor.pivot, 1.0, declining)
+    
+    elif curve == CURVE_TARGET:
+        deviation = np.abs(values - factor.pivot)
+        return np.maximum(0, 1.0 - (deviation / factor.denominator))
+    
+    elif curve == CURVE_RANGE:
+        normalized = np.ones_like(values)
+        below = values < factor.pivot_low
+        above = values > factor.pivot
+        if factor.denominator_low:
+            normalized[below] = (values[below] - factor.min_val) / factor.denominator_low
+        else:
+            normalized[below] = 0
+        if factor.denominator:
+            normalized[above] = 1.0 - (values[above] - factor.pivot) / factor.denominator
+        else:
+            normalized[above] = 0
+        return normalized
+    
+    return np.full_like(values, 0.5)  # Fallback
+
+
+def _score_factor_columns(plan: ScoringPlan, columns: List[np.ndarray]):
+    """
+    Berechnet Scores für viele Standorte eines Produkts auf einmal.
+    
+    Args:
+        plan: Kompilierter ScoringPlan des Produkts
+        columns: Ein float64-Array pro Faktor in Reihenfolge des Plans,
+            NaN steht für einen fehlenden Faktor
+        
+    Returns:
+        Tuple (scores, factor_counts) - ungerundete Scores (0-1) und Anzahl
+        vorhandener Faktoren je Standort
+    """
+    size = len(columns[0]) if columns else 0
+    score = np.zeros(size)
+    factor_counts = np.zeros(size, dtype=np.int64)
+    
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for factor, values in zip(plan.factors, columns):
+            present = ~np.isnan(values)
+            factor_counts += present
+            # Fehlende Faktoren neutral bewerten
+            normalized = np.where(present, _normalize_factor_array(values, factor), 0.5)
+            score += factor.weight * normalized
+    
+    return score, factor_counts
+
+
+def _round_scores(scores: np.ndarray) -> np.ndarray:
+    """
+    Skaliert auf 0-100 und rundet exakt wie calculate_product_score.
+    
+    np.rint weicht von round() nur bei Werten nahe x.x5 ab, diese werden
+    einzeln mit round() nachgerechnet.
+    """
+    percent = scores * 100
+    tenths = percent * 10
+    rounded = np.rint(tenths) / 10
+    
+    near_tie = np.abs(tenths - np.floor(tenths) - 0.5) < 1e-6
+    for position in np.flatnonzero(near_tie | ~np.isfinite(percent)):
+        rounded[position] = round(float(percent[position]), 1)
+    
+    return rounded
+
+
+def _row_products(df: pd.DataFrame, default_product: Optional[str], plans: Mapping[str, ScoringPlan]) -> np.ndarray:
+    """
+    Ermittelt für jede Zeile den Index des Produkts in den ScoringPlans.
+    
+    Returns:
+        int-Array, -1 für Zeilen ohne gültiges Produkt
+    """
+    product_keys = list(plans.keys())
+    default_index = product_keys.index(default_product) if default_product in plans else -1
+    
+    if "product" not in df.columns:
+        return np.full(len(df), default_index, dtype=np.int64)
+    
+    # Nur eindeutige Werte normalisieren statt jeder Zeile
+    codes, uniques = pd.factorize(df["product"])
+    lookup = np.array(
+        [
+            product_keys.index(name) if name in plans else -1
+            for name in (str(value).lower().strip() for value in uniques)
+        ] + [default_index],
+        dtype=np.int64,
+    )
+    # Code -1 (leere Zelle) zeigt auf das Standard-Produkt am Ende
+    return lookup[codes]
+
+
+def validate_columns(columns, source_name: str, default_product: Optional[str]) -> None:
+    """
+    Prüft, ob alle für das Scoring nötigen Spalten vorhanden sind.
+    
+    Args:
+        columns: Spaltennamen der Quelle
+        source_name: Name der Quelle (für Fehlermeldungen)
+        default_product: Standard-Produkt wenn keine product-Spalte vorhanden
+        
+    Raises:
+        HTTPException: 400 bei fehlenden Spalten
+    """
+    # Validiere erforderliche Spalten
+    required_columns = ["location_id", "location_name"]
+    missing_columns = [col for col in required_columns if col not in columns]
+    
+    if missing_columns:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Fehlende Spalten in {source_name}: {', '.join(missing_columns)}"
+        )
+    
+    # Prüfe ob product-Spalte vorhanden ist
+    if "product" not in columns and not default_product:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Keine 'product' Spalte in {source_name} gefunden und kein Standard-Produkt erkannt"
+        )
+
+
+# Zeilennummern je Spalte und Grund in der Diagnose
+DIAGNOSTIC_ROWS = 10
+
+# Gründe, aus denen eine ganze Zeile übersprungen wird (Rest: einzelne Zellen)
+DIAGNOSTIC_ROW_REASONS = ("unknown_product", "too_few_factors", "invalid_location_id")
+
+
+class ScoringDiagnostics:
+    """
+    Zusammenfassung übersprungener Zeilen und ungültiger Zellen eines Uploads.
+    
+    score_dataframe legt die Diagnose eines Blocks in
+    result.attrs["diagnostics"] ab, erfasst aus den Masken des Scorings
+    (keine Ausnahmen pro Zeile). merge() verschiebt die Zeilennummern um die
+    bereits gezählten Zeilen derselben Quelle; nach dem Zusammenführen aller
+    Blöcke sind es Datenzeilen der Quelle (1 = erste Zeile unter der
+    Kopfzeile).
+    """
+    
+    def __init__(self):
+        self.rows_in: Dict[str, int] = {}
+        self.rows_scored = 0
+        # (Quelle, Spalte, Grund) -> [Anzahl, erste Zeilennummern]
+        self.issues: Dict[Tuple[str, Optional[str], str], list] = {}
+    
+    def add(self, source: str, column: Optional[str], reason: str, positions: np.ndarray) -> None:
+        """Erfasst betroffene Zeilen (aufsteigende Positionen im Block)."""
+        if not len(positions):
+            return
+        entry = self.issues.setdefault((source, column, reason), [0, []])
+        entry[0] += len(positions)
+        if len(entry[1]) < DIAGNOSTIC_ROWS:
+            entry[1] = sorted(entry[1] + (positions[:DIAGNOSTIC_ROWS] + 1).tolist())[:DIAGNOSTIC_ROWS]
+    
+    def merge(self, other: "ScoringDiagnostics") -> None:
+        """Hängt die Diagnose eines späteren Blocks an."""
+        for (source, column, reason), (count, rows) in other.issues.items():
+            offset = self.rows_in.get(source, 0)
+            entry = self.issues.setdefault((source, column, reason), [0, []])
+            entry[0] += count
+            if len(entry[1]) < DIAGNOSTIC_ROWS:
+                entry[1] = sorted(entry[1] + [row + offset for row in rows])[:DIAGNOSTIC_ROWS]
+        for source, rows in other.rows_in.items():
+            self.rows_in[source] = self.rows_in.get(source, 0) + rows
+        self.rows_scored += other.rows_scored
+    
+    def merge_frame(self, result: pd.DataFrame) -> None:
+        """merge() mit der Diagnose aus result.attrs (falls vorhanden)."""
+        diagnostics = result.attrs.get("diagnostics")
+        if diagnostics is not None:
+            self.merge(diagnostics)
+    
+    def to_dict(self) -> dict:
+        """
+        Returns:
+            Dictionary mit rows_in, rows_scored, rows_skipped und issues
+            (source, column, reason, count und die ersten DIAGNOSTIC_ROWS
+            Zeilennummern), häufigste zuerst
+        """
+        rows_skipped = sum(
+            count for (_, _, reason), (count, _) in self.issues.items() if reason in DIAGNOSTIC_ROW_REASONS
+        )
+        return {
+            "rows_in": sum(self.rows_in.values()),
+            "rows_scored": self.rows_scored,
+            "rows_skipped": rows_skipped,
+            "issues": [
+                {"source": source, "column": column, "reason": reason, "count": count, "rows": rows}
+                for (source, column, reason), (count, rows) in sorted(
+                    self.issues.items(), key=lambda item: -item[1][0]
+                )
+            ],
+        }
+
+
+def concat_results(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    """pd.concat für Ergebnisblöcke aus score_dataframe, Diagnosen werden zusammengeführt."""
+    result = pd.concat(parts, ignore_index=True)
+    diagnostics = ScoringDiagnostics()
+    for part in parts:
+        diagnostics.merge_frame(part)
+    result.attrs["diagnostics"] = diagnostics
+    return result
+
+
+def score_dataframe(df: pd.DataFrame, source_name: str, default_product: str = None) -> pd.DataFrame:
+    """
+    Spaltenweise Scoring-Engine für hochgeladene Standortdaten.
+    
+    Gruppiert die Zeilen nach Produkt und berechnet alle Scores als
+    Array-Operationen. Die Regeln entsprechen exakt der zeilenweisen
+    Berechnung: fehlende Faktoren werden neutral (0.5) bewertet, Zeilen mit
+    weniger als MIN_FACTORS_PER_ROW Faktoren oder ungültigem Produkt bzw.
+    ungültiger location_id werden übersprungen.
+    
+    Args:
+        df: Pandas DataFrame mit Standortdaten
+        source_name: Name der Quelle (für Fehlermeldungen)
+        default_product: Standard-Produkt wenn keine product-Spalte vorhanden
+        
+    Returns:
+        DataFrame mit location_id, location_name, product, score und einer
+        Spalte pro verwendetem Faktor (NaN = nicht verwendet), in der
+        Reihenfolge der Eingabezeilen; attrs["diagnostics"] enthält die
+        ScoringDiagnostics des Blocks
+    """
+    config = _scoring_config
+    factor_names = config.factor_names
+    empty_result = pd.DataFrame({
+        "location_id": np.array([], dtype=np.int64),
+        "location_name": np.array([], dtype=object),
+        "product": np.array([], dtype=object),
+        "score": np.array([], dtype=np.float64),
+        **{factor_name: np.array([], dtype=np.float64) for factor_name in factor_names},
+    })
+    
+    # Überspringe leere DataFrames
+    if df.empty:
+        return empty_result
+    
+    validate_columns(df.columns, source_name, default_product)
+    
+    row_products = _row_products(df, default_product, config.plans)
+    scored_rows: Dict[str, int] = {}
+    skipped_rows = dict.fromkeys(SKIP_REASONS, 0)
+    
+    diagnostics = ScoringDiagnostics()
+    diagnostics.rows_in[source_name] = len(df)
+    diagnostics.add(source_name, "product", "unknown_product", np.flatnonzero(row_products < 0))
+    
+    # Jede Faktorspalte nur einmal umwandeln, auch wenn mehrere Produkte sie nutzen
+    factor_values = {}
+    for factor_name in factor_names:
+        if factor_name not in df.columns:
+            continue
+        column = df[factor_name]
+        values = factor_values[factor_name] = _factor_column_values(column)
+        if column.dtype.kind != "f":
+            # Nicht umwandelbare Zellen: NaN, obwohl die Zelle nicht leer ist
+            invalid = np.isnan(values) & column.notna().to_numpy()
+            diagnostics.add(source_name, factor_name, "not_numeric", np.flatnonzero(invalid))
+    
+    score_parts = []
+    for product_index, (product, plan) in enumerate(config.plans.items()):
+        rows = np.flatnonzero(row_products == product_index)
+        if len(rows) == 0:
+            continue
+        
+        columns = [
+            factor_values[factor_name][rows] if factor_name in factor_values else np.full(len(rows), np.nan)
+            for factor_name in plan.factor_names
+        ]
+        scores, factor_counts = _score_factor_columns(plan, columns)
+        
+        # Werte außerhalb von min/max werden beim Normalisieren begrenzt
+        for factor, values in zip(plan.factors, columns):
+            outside = (values < factor.min_val) | (values > factor.max_val)
+            diagnostics.add(source_name, factor.name, "out_of_range", rows[outside])
+        
+        # Überspringe Zeilen mit zu wenig Faktoren
+        enough_factors = factor_counts >= MIN_FACTORS_PER_ROW
+        diagnostics.add(source_name, None, "too_few_factors", rows[~enough_factors])
+        rows = rows[enough_factors]
+        scores = scores[enough_factors]
+        
+        # Zeilen mit ungültiger location_id überspringen
+        location_ids, valid_ids = _location_id_values(df["location_id"], rows)
+        diagnostics.add(source_name, "location_id", "invalid_location_id", rows[~valid_ids])
+        diagnostics.rows_scored += int(valid_ids.sum())
+        
+        if metrics.enabled:
+            scored_rows[product] = int(valid_ids.sum())
+            skipped_rows["factors"] += len(enough_factors) - len(rows)
+            skipped_rows["location_id"] += len(rows) - scored_rows[product]
+        
+        part = {
+            "row": rows[valid_ids],
+            "location_id": location_ids[valid_ids],
+            "product": np.full(int(valid_ids.sum()), product, dtype=object),
+            "score": scores[valid_ids],
+        }
+        for factor_name, column in zip(plan.factor_names, columns):
+            part[factor_name] = column[enough_factors][valid_ids]
+        score_parts.append(pd.DataFrame(part))
+    
+    if metrics.enabled:
+        skipped_rows["product"] = int((row_products < 0).sum())
+        metrics.count_rows(len(df), scored_rows, skipped_rows)
+    
+    if not score_parts:
+        empty_result.attrs["diagnostics"] = diagnostics
+        return empty_result
+    
+    # Ursprüngliche Zeilenreihenfolge wiederherstellen
+    result = pd.concat(score_parts, ignore_index=True).sort_values("row", kind="stable")
+    names = df["location_name"].to_numpy()[result["row"].to_numpy()]
+    result["location_name"] = np.array([str(name) for name in names], dtype=object)
+    result["score"] = _round_scores(result["score"].to_numpy())
+    
+    result = result.reindex(columns=empty_result.columns).reset_index(drop=True)
+    result.attrs["diagnostics"] = diagnostics
+    return result
+
+
+def dataframe_to_records(result: pd.DataFrame) -> List[dict]:
+    """
+    Wandelt das Ergebnis von score_dataframe in die JSON-Ergebnisliste um.
+    
+    Args:
+        result: DataFrame aus score_dataframe
+        
+    Returns:
+        Liste mit Score-Ergebnissen (location_id, location_name, product,
+        score, factors_used)
+    """
+    records = [None] * len(result)
+    products = result["product"].to_numpy()
+    
+    # Viele kleine Dicts: der zyklische GC würde sonst wiederholt alle scannen
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        _fill_records(records, result, products)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    
+    return records
+
+
+def _fill_records(records: List[Optional[dict]], result: pd.DataFrame, products: np.ndarray) -> None:
+    """Füllt die Ergebnisliste produktweise (siehe dataframe_to_records)."""
+    for product, plan in _scoring_config.plans.items():
+        product_rows = np.flatnonzero(products == product)
+        if len(product_rows) == 0:
+            continue
+        
+        factor_names = plan.factor_names
+        factor_values = np.column_stack([result[factor_name].to_numpy()[product_rows] for factor_name in factor_names])
+        
+        # Zeilen mit gleichem Muster vorhandener Faktoren gemeinsam umwandeln
+        present = ~np.isnan(factor_values)
+        patterns = present @ (1 << np.arange(len(factor_names)))
+        for pattern in np.unique(patterns):
+            selection = patterns == pattern
+            rows = product_rows[selection]
+            used = present[selection][0]
+            used_names = [name for name, is_used in zip(factor_names, used) if is_used]
+            
+            for position, location_id, location_name, score, values in zip(
+                rows.tolist(),
+                result["location_id"].to_numpy()[rows].tolist(),
+                result["location_name"].to_numpy()[rows].tolist(),
+                result["score"].to_numpy()[rows].tolist(),
+                factor_values[selection][:, used].tolist(),
+            ):
+                records[position] = {
+                    "location_id": location_id,
+                    "location_name": location_name,
+                    "product": product,
+                    "score": score,
+                    "factors_used": dict(zip(used_names, values))
+                }
+
+
+def process_dataframe(df: pd.DataFrame, source_name: str, default_product: str = None) -> List[dict]:
+    """
+    Verarbeitet ein DataFrame und berechnet Scores.
+    
+    Args:
+        df: Pandas DataFrame mit Standortdaten
+        source_name: Name der Quelle (für Fehlermeldungen)
+        default_product: Standard-Produkt wenn keine product-Spalte vorhanden
+        
+    Returns:
+        Liste mit Score-Ergebnissen
+    """
+    return dataframe_to_records(score_dataframe(df, source_name, default_product))
+
+
+@app.get("/template/csv")
+async def download_csv_template(request: Request):
+    """
+    Lädt eine CSV-Vorlagendatei mit Beispieldaten für alle Produkte herunter.
+    
+    Die Datei wird einmal erzeugt und als Bytes mit ETag vorgehalten.
+    """
+    artifact = await template_artifact("csv")
+    return template_response(request, artifact, "text/csv", "standort_template.csv")
+
+
+def build_csv_template() -> bytes:
+    """Erzeugt die CSV-Vorlage mit einem Beispiel pro Produkt."""
+    # Erstelle Template-Daten für alle Produkte (Reduziert auf Top 5)
+    pv_data = {
+        "location_id": 1,
+        "location_name": "Beispiel PV-Standort",
+        "product": "pv",
+        "roof_area_sqm": 250,
+        "solar_irradiation": 1100,
+        "roof_orientation_degrees": 180,
+        "roof_tilt_degrees": 32,
+        "electricity_price_eur": 0.35
+    }
+    
+    storage_data = {
+        "location_id": 2,
         "location_name": "Beispiel Speicher-Standort",
         "product": "storage",
         "existing_pv_kwp": 50,
@@ -559,19 +4759,28 @@ async def download_csv_template():
     stream = io.StringIO()
     df.to_csv(stream, index=False)
     
-    return StreamingResponse(
-        io.BytesIO(stream.getvalue().encode()),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=standort_template.csv"}
-    )
+    return stream.getvalue().encode()
 
 
 @app.get("/template/excel")
-async def download_excel_template():
+async def download_excel_template(request: Request):
     """
     Lädt eine Excel-Vorlagendatei mit Beispieldaten für alle Produkte herunter.
     Enthält separate Sheets für PV, Storage und Charging mit realistischen Beispieldaten.
+    
+    Die Datei wird einmal erzeugt und als Bytes mit ETag vorgehalten.
     """
+    artifact = await template_artifact("excel")
+    return template_response(
+        request,
+        artifact,
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "Standort_Scoring_Template.xlsx",
+    )
+
+
+def build_excel_template() -> bytes:
+    """Erzeugt die Excel-Vorlage mit PV-, Storage-, Charging- und Info-Sheet."""
     stream = io.BytesIO()
     
     with pd.ExcelWriter(stream, engine='openpyxl') as writer:
@@ -811,13 +5020,84 @@ async def download_excel_template():
             ws = writer.sheets['Info']
             ws.column_dimensions['A'].width = 60
     
-    stream.seek(0)
+    return stream.getvalue()
+
+
+# Vorlagen-Erzeugung je Art
+TEMPLATE_BUILDERS = {
+    "csv": build_csv_template,
+    "excel": build_excel_template,
+}
+
+# Clients prüfen per If-None-Match, ob ihre Kopie noch aktuell ist
+TEMPLATE_CACHE_CONTROL = "no-cache"
+
+
+class TemplateArtifact(NamedTuple):
+    """Fertig erzeugte Vorlage"""
+    content: bytes
+    etag: str
+    fingerprint: str  # PRODUCT_FACTORS-Fingerprint beim Erzeugen
+
+
+_template_artifacts: Dict[str, TemplateArtifact] = {}
+_template_lock = threading.Lock()
+
+
+def build_template_artifact(kind: str) -> TemplateArtifact:
+    """
+    Liefert die Vorlage `kind` und erzeugt sie nur, wenn sie fehlt oder
+    PRODUCT_FACTORS sich seit dem Erzeugen geändert hat.
+    """
+    fingerprint = _scoring_config.fingerprint
+    
+    with _template_lock:
+        artifact = _template_artifacts.get(kind)
+        if artifact is None or artifact.fingerprint != fingerprint:
+            content = TEMPLATE_BUILDERS[kind]()
+            artifact = TemplateArtifact(
+                content=content,
+                etag=f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+                fingerprint=fingerprint,
+            )
+            _template_artifacts[kind] = artifact
+    return artifact
+
+
+async def template_artifact(kind: str) -> TemplateArtifact:
+    """Vorlage aus dem Cache; das Erzeugen läuft im Thread-Pool."""
+    artifact = _template_artifacts.get(kind)
+    if artifact is not None and artifact.fingerprint == _scoring_config.fingerprint:
+        return artifact
     
-    return StreamingResponse(
-        stream,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=Standort_Scoring_Template.xlsx"}
-    )
+    release = blocking_work.admit()
+    try:
+        return await blocking_work.run(build_template_artifact, kind)
+    finally:
+        release()
+
+
+def prebuild_templates() -> None:
+    """Erzeugt alle Vorlagen vorab (z.B. vor dem Start der Worker)."""
+    for kind in TEMPLATE_BUILDERS:
+        build_template_artifact(kind)
+
+
+def template_response(request: Request, artifact: TemplateArtifact, media_type: str, filename: str) -> Response:
+    """
+    Antwort für eine Vorlage: 304 wenn If-None-Match zum ETag passt,
+    sonst die vorgehaltenen Bytes.
+    """
+    headers = {"ETag": artifact.etag, "Cache-Control": TEMPLATE_CACHE_CONTROL}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in tags or artifact.etag in tags:
+            return Response(status_code=304, headers=headers)
+    
+    headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return Response(content=artifact.content, media_type=media_type, headers=headers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+"""
+Pre-fork-Server mit mehreren Workern für die Scoring-API.
+
+Der Elternprozess importiert main (und kompiliert damit die
+Scoring-Konfiguration), lädt pandas/numpy, erzeugt die CSV-/Excel-Vorlagen
+einmal und startet dann die Worker per fork. Sie teilen diese
+Speicherseiten (copy-on-write), statt sie jeweils neu aufzubauen, und
+nehmen Verbindungen über denselben Socket an.
+
+Worker werden geordnet ausgetauscht: Nach --max-requests Anfragen oder
+oberhalb von --max-memory-mb RSS nimmt ein Worker keine Verbindungen mehr
+an, beendet laufende Anfragen (und seine Hintergrund-Jobs) und endet; der
+Elternprozess startet aus dem vorgeladenen Zustand einen neuen.
+
+Verwendung:
+    python serve.py --workers 4 [--host 0.0.0.0] [--port 8000]
+                    [--max-requests 5000] [--max-memory-mb 1024]
+
+Nur Unix (os.fork). Unter Windows einen einzelnen Worker mit
+`uvicorn main:app` starten.
+"""
+
+import argparse
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+# Endet ein Worker früher als nach so vielen Sekunden, wird er verzögert neu gestartet
+MIN_WORKER_SECONDS = 1.0
+
+
+def log(message):
+    print(f"[serve {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def preload():
+    """Importiert main und baut vor dem fork alles auf, was die Worker teilen können."""
+    # Der Import kompiliert bereits die Scoring-Konfiguration
+    import main
+
+    main.prebuild_templates()
+    # pd/np lädt main erst bei Bedarf; hier vorab, damit alle Worker sie teilen
+    main.load_lazy_module(main.pd)
+    main.load_lazy_module(main.np)
+    # Bis hier erzeugte Objekte werden nie freigegeben: Der GC der Worker
+    # berührt (und kopiert damit) ihre Speicherseiten nicht
+    gc.collect()
+    gc.freeze()
+    return main
+
+
+def resident_bytes():
+    """Aktueller RSS dieses Prozesses (ohne /proc der bisherige Höchstwert)."""
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RecyclingServer(uvicorn.Server):
+    """uvicorn-Server, der sich bei Erreichen einer Austauschgrenze geordnet beendet."""
+
+    def __init__(self, config, jobs, max_requests, max_memory_bytes):
+        super().__init__(config)
+        self.jobs = jobs
+        self.max_requests = max_requests
+        self.max_memory_bytes = max_memory_bytes
+
+    def recycle_reason(self):
+        if self.max_requests and self.server_state.total_requests >= self.max_requests:
+            return f"{self.server_state.total_requests} Anfragen"
+        if self.max_memory_bytes:
+            rss = resident_bytes()
+            if rss > self.max_memory_bytes:
+                return f"{rss / 1e6:.0f} MB RSS"
+        return None
+
+    async def on_tick(self, counter):
+        if await super().on_tick(counter):
+            return True
+        # Einmal pro Sekunde; laufende Hintergrund-Jobs würden beim Beenden abgebrochen
+        if counter % 10 or self.jobs.pending:
+            return False
+        reason = self.recycle_reason()
+        if reason:
+            log(f"Worker wird nach {reason} ausgetauscht")
+            return True
+        return False
+
+
+def run_worker(app, jobs, listener, args):
+    config = uvicorn.Config(app, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    max_requests = args.max_requests
+    if max_requests and args.max_requests_jitter:
+        # Neustarts streuen, damit nicht alle Worker gleichzeitig ausgetauscht werden
+        max_requests += random.randint(0, args.max_requests_jitter)
+    server = RecyclingServer(config, jobs, max_requests, args.max_memory_mb * 1024 * 1024)
+    server.run(sockets=[listener])
+
+
+def serve(args):
+    if not hasattr(os, "fork"):
+        raise SystemExit("serve.py benötigt os.fork; auf dieser Plattform `uvicorn main:app` verwenden")
+
+    started = time.perf_counter()
+    main = preload()
+    log(f"Scoring-Konfiguration und Vorlagen in {time.perf_counter() - started:.2f} s vorgeladen")
+
+    listener = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(args.backlog)
+    listener.set_inheritable(True)
+
+    workers = {}
+    stopping = False
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            random.seed()
+            code = 0
+            try:
+                run_worker(main.app, main.scoring_jobs, listener, args)
+            except BaseException:
+                code = 1
+                raise
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        workers[pid] = (slot, time.monotonic())
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for slot in range(args.workers):
+        spawn(slot)
+    log(f"{args.workers} Worker auf http://{args.host}:{args.port}")
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot, spawned_at = workers.pop(pid, (None, 0.0))
+        if slot is None or stopping:
+            continue
+        if time.monotonic() - spawned_at < MIN_WORKER_SECONDS:
+            log(f"Worker {pid} direkt nach dem Start beendet (Status {status}), Neustart in 1 s")
+            time.sleep(1)
+        spawn(slot)
+
+    listener.close()
+    log("Alle Worker beendet")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-requests", type=int, default=5000, help="Worker nach so vielen Anfragen austauschen (0 = nie)")
+    parser.add_argument("--max-requests-jitter", type=int, default=500, help="zufällige zusätzliche Anfragen je Worker")
+    parser.add_argument("--max-memory-mb", type=int, default=1024, help="Worker oberhalb dieses RSS austauschen (0 = nie)")
+    parser.add_argument("--keep-alive", type=int, default=5, help="Keep-Alive-Timeout in Sekunden")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="warning")
+    serve(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main_cli()